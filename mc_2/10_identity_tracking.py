@@ -0,0 +1,54 @@
+import cv2
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.capture import LatestFrameCapture
+from helpers.draw import draw_detections
+from helpers.identity import Gallery, IdentityTracker
+from helpers.models import detect_faces
+
+if __name__ == "__main__":
+    # reference images of the people to recognize, a gallery enrolled with
+    # 11_gallery_enrollment.py can be used instead with Gallery.from_store
+    gallery = Gallery.from_images(
+        {
+            "jeremy": ["images/jeremy1.jpg", "images/jeremy2.jpg"],
+            "james": ["images/james.jpg"],
+            "richard": ["images/richard.jpg"],
+        }
+    )
+
+    # faces are embedded once per track, the name follows the track afterwards
+    identity_tracker = IdentityTracker(gallery, confirm_every=60)
+
+    cap = LatestFrameCapture(0)
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+
+        # face detection
+        detections = detect_faces(frame, DETECTOR_BACKEND)
+
+        track_ids, names = identity_tracker.update(frame, detections)
+        draw_detections(
+            frame,
+            detections,
+            [
+                f"{name if name else 'unknown'} #{track_id}"
+                for track_id, name in zip(track_ids, names)
+            ],
+        )
+
+        cv2.imshow("frame", frame)
+
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+
+    stats = identity_tracker.stats()
+    print(
+        f"{stats['embeddings']} embeddings for {stats['faces']} faces "
+        f"over {stats['frames']} frames"
+    )
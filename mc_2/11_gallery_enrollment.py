@@ -0,0 +1,16 @@
+from helpers.enrollment import EnrollmentPipeline
+
+if __name__ == "__main__":
+    # one sub directory per person, e.g. gallery/jeremy/*.jpg
+    path_gallery = "gallery"
+    path_store = "gallery_store"
+
+    # rerunning after an interruption continues from the last checkpoint
+    pipeline = EnrollmentPipeline(path_store, batch_size=64, decode_workers=8)
+    stats = pipeline.run([path_gallery])
+
+    print(
+        f"{stats['images']} new images, {stats['faces']} faces enrolled, "
+        f"{stats['failed']} failed, {stats['resumed']} already enrolled, "
+        f"{stats['elapsed']:.1f}s"
+    )
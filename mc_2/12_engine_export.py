@@ -0,0 +1,39 @@
+from helpers.engine import export_engines, save_engine_config
+
+if __name__ == "__main__":
+    image_dir = "images"
+    engine = "onnxruntime"  # or "openvino" with onnxruntime-openvino installed
+    threads = 4
+    quantized = True
+
+    # minimum agreement with the tensorflow models before the engine is used
+    min_cosine = 0.98
+    min_top1_agreement = 0.9
+    min_iou = 0.8
+
+    reports = export_engines(image_dir, engine, threads, quantized)
+
+    for model_name, report in reports.items():
+        print(
+            f"{model_name:<12} "
+            f"{report['reference_ms']:8.1f} ms -> {report['engine_ms']:8.1f} ms "
+            f"({report['speedup']:.1f}x)"
+        )
+    print(f"Facenet512 min cosine {reports['Facenet512']['min_cosine']:.4f}")
+    print(f"Emotion top-1 agreement {reports['Emotion']['top1_agreement']:.2f}")
+    print(
+        "Emotion top-1 agreement with DeepFace.analyze "
+        f"{reports['Emotion']['deepface_top1_agreement']:.2f}"
+    )
+    print(f"yolov8 mean iou {reports['yolov8']['mean_iou']:.2f}")
+
+    if (
+        reports["Facenet512"]["min_cosine"] >= min_cosine
+        and reports["Emotion"]["top1_agreement"] >= min_top1_agreement
+        and reports["Emotion"]["deepface_top1_agreement"] >= min_top1_agreement
+        and reports["yolov8"]["mean_iou"] >= min_iou
+    ):
+        save_engine_config(engine, threads, quantized, reports)
+        print(f"Inference engine set to {engine}")
+    else:
+        print("Parity check failed, staying on tensorflow")
@@ -0,0 +1,30 @@
+from helpers.evaluation import evaluate_models
+
+if __name__ == "__main__":
+    # one sub directory per person, e.g. dataset/jeremy/*.jpg
+    path_dataset = "dataset"
+    path_cache = "evaluation"
+
+    # faces are detected and cropped once for all models, every crop is
+    # embedded once per model, all pairs are scored from the cached
+    # embeddings, rerunning only embeds new images
+    reports = evaluate_models(
+        path_dataset,
+        model_names=["Facenet512", "Facenet", "ArcFace"],
+        metrics=["cosine", "euclidean_l2"],
+        cache_dir=path_cache,
+    )
+
+    for report in reports:
+        throughput = (
+            f"{report['faces_per_second']:7.1f} faces/s"
+            if report["faces_per_second"] is not None
+            else "     cached"
+        )
+        print(
+            f"{report['model']:<12} {report['metric']:<13} "
+            f"eer {report['eer']:.3f} @ {report['eer_threshold']:.3f}  "
+            f"best {report['best_threshold']:.3f} "
+            f"({report['best_balanced_accuracy']:.3f})  "
+            f"auc {report['auc']:.3f}  {throughput}"
+        )
@@ -0,0 +1,64 @@
+import cv2
+
+from helpers.capture import LatestFrameCapture
+from helpers.draw import draw_detections
+from helpers.identity import Gallery
+from helpers.pipeline import (
+    AgeHead,
+    AnalysisPipeline,
+    EmbeddingHead,
+    EmotionHead,
+    GenderHead,
+)
+
+if __name__ == "__main__":
+    # one detection pass per frame feeds every head, drop a head to skip it
+    pipeline = AnalysisPipeline(
+        [
+            EmbeddingHead("Facenet512"),
+            EmotionHead(batch_size=64),
+            AgeHead(),
+            GenderHead(),
+        ]
+    )
+
+    # the gallery is cropped and aligned the same way as the probe faces
+    gallery = Gallery.from_images(
+        {
+            "jeremy": ["images/jeremy1.jpg", "images/jeremy2.jpg"],
+            "james": ["images/james.jpg"],
+            "richard": ["images/richard.jpg"],
+        },
+        detector_backend=pipeline.detector_backend,
+        align=pipeline.align,
+    )
+
+    cap = LatestFrameCapture(0)
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+
+        analysis = pipeline(frame)
+        names, _ = gallery.match(analysis["embedding"])
+        draw_detections(
+            frame,
+            analysis.detections,
+            [
+                f"{name if name else 'unknown'} {label}"
+                for name, label in zip(names, pipeline.labels(analysis))
+            ],
+        )
+
+        cv2.imshow("frame", frame)
+
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+
+    print(
+        ", ".join(f"{name} {ms:.1f}" for name, ms in pipeline.stats().items()),
+        "per frame",
+    )
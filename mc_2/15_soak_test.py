@@ -0,0 +1,123 @@
+import argparse
+import importlib
+import tempfile
+from typing import Any, Iterator
+
+from helpers.capture import LatestFrameCapture, ReplaySource, SyntheticSource
+from helpers.soak import SoakMonitor
+
+
+def face_detection_loop(source: Any) -> Iterator[None]:
+    pong = importlib.import_module("6_pong")
+    face_detection = pong.FaceDetection(
+        1280,
+        720,
+        left_color=(255, 0, 0),
+        right_color=(0, 255, 0),
+        source=source,
+        threaded_capture=False,
+    )
+    try:
+        while face_detection.cap.isOpened():
+            if not face_detection.draw():
+                continue
+            face_detection.map_control()
+            yield
+    finally:
+        face_detection.close()
+
+
+def hand_tracking_loop(source: Any) -> Iterator[None]:
+    handtracking = importlib.import_module("7_handtracking")
+    hand_tracking = handtracking.HandTracking(
+        1280, 720, source=source, threaded_capture=False
+    )
+    try:
+        with hand_tracking.hands as hands:
+            while hand_tracking.cap.isOpened():
+                if not hand_tracking.draw(hands):
+                    continue
+                hand_tracking.event()
+                yield
+    finally:
+        hand_tracking.close()
+
+
+def emotion_loop(source: Any) -> Iterator[None]:
+    emotion = importlib.import_module("5_emotion_detection_video")
+    quality_gate = emotion.FaceQualityGate(min_size=48, min_sharpness=50.0)
+    tracker = emotion.IouTracker()
+    timeline = emotion.EmotionTimeline(tempfile.mkdtemp(prefix="soak_timeline_"))
+    cap = LatestFrameCapture(source, threaded=False)
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            emotion.analyze_emotions(frame, quality_gate, tracker, timeline)
+            yield
+    finally:
+        cap.release()
+
+
+LOOPS = {
+    "face": face_detection_loop,
+    "hand": hand_tracking_loop,
+    "emotion": emotion_loop,
+}
+
+
+if __name__ == "__main__":
+    # e.g. six hours of camera time at 30 fps from a looped recording
+    #   python 15_soak_test.py --loop face --frames 648000 --video videos/kiosk.mp4
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loop", choices=list(LOOPS), default="face")
+    parser.add_argument("--frames", type=int, default=108000)
+    parser.add_argument("--video", default=None)
+    parser.add_argument("--interval", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=2000)
+    parser.add_argument("--max-slope", type=float, default=5.0)
+    parser.add_argument("--no-trace", action="store_true")
+    args = parser.parse_args()
+
+    # frames are pulled by the loop itself, each one is processed exactly once
+    # and as fast as the loop can take them, no capture thread runs alongside
+    if args.video is not None:
+        source = ReplaySource(args.video)
+    else:
+        source = SyntheticSource(1280, 720, realtime=False)
+
+    monitor = SoakMonitor(
+        interval=args.interval,
+        warmup=args.warmup,
+        max_slope=args.max_slope,
+        trace=not args.no_trace,
+    )
+    monitor.start()
+    loop = LOOPS[args.loop](source)
+    for _ in zip(range(args.frames), loop):
+        monitor.step()
+        if monitor.frames % args.interval == 0 and monitor.samples:
+            sample = monitor.samples[-1]
+            print(
+                f"frame {sample['frame']:>8} rss {sample['rss_mb']:8.1f} MB "
+                f"traced {sample['traced_mb']:8.1f} MB objects {sample['objects']}"
+            )
+    loop.close()
+    monitor.stop()
+
+    report = monitor.report()
+    print(
+        f"{report['frames']} frames in {report['seconds']:.0f}s, "
+        f"rss {report['rss_slope']:+.2f} MB/h, "
+        f"traced {report['traced_slope']:+.2f} MB/h, "
+        f"objects {report['objects_slope']:+.0f}/h"
+    )
+    if not report["passed"]:
+        print(f"Memory grows faster than {args.max_slope} MB/h")
+        print("Top growing allocation sites since warmup:")
+        print("\n".join(report["growing_sites"]))
+        print("Top growing object types since warmup:")
+        print("\n".join(report["growing_types"]))
+        exit(1)
+    print("No memory growth above the limit")
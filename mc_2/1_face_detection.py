@@ -1,22 +1,35 @@
+import functools
+
 import cv2
-from deepface import DeepFace
 
+from helpers.backend import DETECTOR_BACKEND
 from helpers.draw import draw_bbox_face_detection
+from helpers.models import detect_faces, thread_safe_detector
+from helpers.tiling import TiledDetector
 
 if __name__ == "__main__":
     path_img = "images/richard.jpg"
 
+    # split large images into overlapping tiles at several scales, so small
+    # faces in crowd photos survive the detector's internal downscale
+    TILED = False
+
     # read images
     img_1 = cv2.imread(path_img)
 
-    # face verification
-    result = DeepFace.extract_faces(
-        img_1, detector_backend="yolov8", enforce_detection=False
-    )
-
-    # display result
-    for face in result:
-        draw_bbox_face_detection(img_1, face)
+    if TILED:
+        detector = TiledDetector(
+            functools.partial(detect_faces, detector_backend=DETECTOR_BACKEND),
+            tile=640,
+            overlap=160,
+            scales=(1.0, 0.5),
+            # deepface's own detectors are not safe to share between threads
+            workers=4 if thread_safe_detector(DETECTOR_BACKEND) else 1,
+        )
+        draw_bbox_face_detection(img_1, detector(img_1))
+    else:
+        # face detection
+        draw_bbox_face_detection(img_1, detect_faces(img_1, DETECTOR_BACKEND))
 
     cv2.imshow("frame", img_1)
     cv2.waitKey(0)
@@ -1,20 +1,28 @@
 import cv2
-from deepface import DeepFace
 
+from helpers.backend import DETECTOR_BACKEND
+from helpers.capture import LatestFrameCapture
+from helpers.detections import DetectionBatch
 from helpers.draw import draw_bbox_face_detection
+from helpers.models import detect_faces
+from helpers.motion import MotionGate
 
 if __name__ == "__main__":
-    cap = cv2.VideoCapture(0)
+    # the detector only runs again when the scene changed, or once a second
+    motion_gate = MotionGate(threshold=0.01, max_interval=1.0)
+    detections = DetectionBatch.empty()
+
+    cap = LatestFrameCapture(0)
     while True:
-        _, frame = cap.read()
+        ok, frame = cap.read()
+        if not ok:
+            break
 
         # face detection
-        result = DeepFace.extract_faces(
-            frame, detector_backend="yolov8", enforce_detection=False
-        )
+        if motion_gate(frame):
+            detections = detect_faces(frame, DETECTOR_BACKEND)
 
-        for face in result:
-            draw_bbox_face_detection(frame, face)
+        draw_bbox_face_detection(frame, detections)
 
         cv2.imshow("frame", frame)
 
@@ -23,3 +31,6 @@ if __name__ == "__main__":
 
     cap.release()
     cv2.destroyAllWindows()
+
+    stats = motion_gate.stats()
+    print(f"detector skipped on {stats['skipped']}/{stats['frames']} frames")
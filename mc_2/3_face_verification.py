@@ -1,7 +1,10 @@
 import cv2
-from deepface import DeepFace
 
+from helpers.backend import DETECTOR_BACKEND
 from helpers.draw import draw_verification_result
+from helpers.identity import FACENET512_THRESHOLD
+from helpers.models import detect_faces, embed_faces
+from helpers.quality import FaceQualityGate, align_crop
 
 if __name__ == "__main__":
     path_img_1 = "images/jeremy1.jpg"
@@ -12,10 +15,38 @@ if __name__ == "__main__":
     img_1 = cv2.imread(path_img_1)
     img_2 = cv2.imread(path_img_2)
 
-    # face verification
-    result = DeepFace.verify(
-        img_1, img_2, model_name="Facenet512", detector_backend="yolov8"
-    )
+    # skip the recognition model when either face is unusable, the faces
+    # that pass are embedded as crops so nothing is detected twice
+    quality_gate = FaceQualityGate()
+    faces = []
+    facial_areas = {}
+    for name, img in (("img1", img_1), ("img2", img_2)):
+        detections = quality_gate(img, detect_faces(img, DETECTOR_BACKEND))
+        if not len(detections):
+            print(f"Face quality too low for verification: {quality_gate.stats()}")
+            exit()
+        index = detections.largest()
+        landmarks = detections.landmarks
+        faces.append(
+            align_crop(
+                img,
+                detections.boxes[index],
+                None if landmarks is None else landmarks[index],
+            )
+        )
+        facial_areas[name] = detections.box(index)
+
+    # face verification, embeddings are l2 normalized so the cosine
+    # distance is one dot product, compared like Gallery.match
+    embeddings = embed_faces(faces, "Facenet512")
+    distance = float(1 - embeddings[0] @ embeddings[1])
+    result = {
+        "verified": distance <= FACENET512_THRESHOLD,
+        "distance": distance,
+        "threshold": FACENET512_THRESHOLD,
+        "model": "Facenet512",
+        "facial_areas": facial_areas,
+    }
 
     # display result
     frame = draw_verification_result(img_1, img_2, result)
@@ -1,15 +1,20 @@
 import cv2
-from deepface import DeepFace
 
+from helpers.backend import DETECTOR_BACKEND
 from helpers.draw import draw_emotion
+from helpers.models import detect_faces, predict_emotions
+from helpers.quality import crop_box
+from helpers.timeline import EMOTIONS
 
 if __name__ == "__main__":
     img = cv2.imread("images/emotions.jpg")
 
-    result = DeepFace.analyze(img, detector_backend="yolov8", actions=["emotion"])
+    # all faces go through the emotion model in one batch
+    faces = detect_faces(img, DETECTOR_BACKEND)
+    emotions = predict_emotions([crop_box(img, box) for box in faces.boxes])
+    faces.labels = [EMOTIONS[i] for i in emotions.argmax(axis=1)]
 
-    for face in result:
-        draw_emotion(img, face)
+    draw_emotion(img, faces)
 
     cv2.imshow("frame", img)
     cv2.waitKey(0)
@@ -1,23 +1,61 @@
+import time
+
 import cv2
-from deepface import DeepFace
+import numpy as np
 
+from helpers.backend import DETECTOR_BACKEND
+from helpers.capture import LatestFrameCapture
+from helpers.detections import DetectionBatch
 from helpers.draw import draw_emotion
+from helpers.models import detect_faces, predict_emotions
+from helpers.motion import MotionGate
+from helpers.quality import FaceQualityGate, crop_box
+from helpers.timeline import EMOTIONS, EmotionTimeline
+from helpers.tracking import IouTracker
+
+
+def analyze_emotions(
+    frame: np.ndarray,
+    quality_gate: FaceQualityGate,
+    tracker: IouTracker,
+    timeline: EmotionTimeline,
+) -> DetectionBatch:
+    # face detection
+    detections = detect_faces(frame, DETECTOR_BACKEND)
+    faces = quality_gate(frame, detections)
+    track_ids = tracker.update(faces)
+
+    # emotion analysis on the faces that passed the gate, in one batch
+    start = time.perf_counter()
+    emotions = predict_emotions([crop_box(frame, box) for box in faces.boxes])
+    faces.labels = [EMOTIONS[i] for i in emotions.argmax(axis=1)]
+    quality_gate.record_downstream(time.perf_counter() - start, len(faces))
+    timeline.update(track_ids, emotions, time.time())
+    return faces
+
 
 if __name__ == "__main__":
-    cap = cv2.VideoCapture(0)
+    # faces that are too small, blurred or turned away skip the emotion model
+    quality_gate = FaceQualityGate(min_size=48, min_sharpness=50.0)
+
+    # per person emotion over time, flushed as compact .npz snapshots
+    tracker = IouTracker()
+    timeline = EmotionTimeline("timeline", window=90, flush_interval=60.0)
+
+    # while the scene stays still the last faces and emotions are reused
+    motion_gate = MotionGate(threshold=0.01, max_interval=1.0)
+    faces = DetectionBatch.empty()
+
+    cap = LatestFrameCapture(0)
     while True:
-        _, frame = cap.read()
+        ok, frame = cap.read()
+        if not ok:
+            break
 
-        # face detection
-        result = DeepFace.analyze(
-            frame,
-            detector_backend="yolov8",
-            actions=["emotion"],
-            enforce_detection=False,
-        )
+        if motion_gate(frame):
+            faces = analyze_emotions(frame, quality_gate, tracker, timeline)
 
-        for face in result:
-            draw_emotion(frame, face)
+        draw_emotion(frame, faces)
 
         cv2.imshow("frame", frame)
 
@@ -26,3 +64,13 @@ if __name__ == "__main__":
 
     cap.release()
     cv2.destroyAllWindows()
+    timeline.flush(time.time())
+
+    stats = quality_gate.stats()
+    print(
+        f"{stats['skipped']}/{stats['seen']} faces skipped "
+        f"({stats['skipped_ratio']:.0%}), about {stats['seconds_saved']:.1f}s saved"
+    )
+
+    stats = motion_gate.stats()
+    print(f"models skipped on {stats['skipped']}/{stats['frames']} frames")
@@ -1,9 +1,20 @@
+import argparse
+import functools
 import random
-from typing import Dict, Tuple, Union, List
+from typing import Any, Callable, Dict, Tuple, Union, List
 
 import cv2
+import numpy as np
 import pygame
-from deepface import DeepFace
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.capture import LatestFrameCapture
+from helpers.detections import DetectionBatch
+from helpers.isolation import VisionProcess
+from helpers.models import detect_faces
+from helpers.netplay import RollbackSession, parse_address
+from helpers.preprocess import FramePreprocessor
+from helpers.preview import CameraPreview, preview_layout, quit_requested
 
 
 class Paddle:
@@ -71,6 +82,7 @@ class Ball:
         radius: int,
         velocity: int,
         color: Tuple[int, int, int],
+        rng: Union[random.Random, None] = None,
     ) -> None:
         self.screen = screen
         self.x = x
@@ -78,6 +90,7 @@ class Ball:
         self.radius = radius
         self.velocity = velocity
         self.color = color
+        self.rng = rng if rng else random.Random()
         self.direction_x = 1
         self.direction_y = 1
         self.ball = pygame.Rect(x, y, radius, radius)
@@ -125,7 +138,7 @@ class Ball:
         self.ball.x = self.screen.get_width() // 2 - self.radius // 2
         self.ball.y = self.screen.get_height() // 2 - self.radius // 2
 
-        self.direction_x = random.choice([-1, 1])
+        self.direction_x = self.rng.choice([-1, 1])
         if direction == "top":
             self.direction_y = -1
         elif direction == "bottom":
@@ -178,6 +191,10 @@ class Game:
         ball_color: Tuple[int, int, int],
         ball_velocity: int,
         score_color: Tuple[int, int, int],
+        seed: Union[int, None] = None,
+        preview: Union[str, None] = None,
+        preview_size: Tuple[int, int] = (1280, 720),
+        preview_scale: float = 0.35,
     ) -> None:
         pygame.init()
         self.screen_width = screen_width
@@ -190,8 +207,26 @@ class Game:
         self.ball_color = ball_color
         self.ball_velocity = ball_velocity
         self.score_color = score_color
-
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
+        # a shared seed makes every serve identical on both peers of a match
+        self.rng = random.Random(seed)
+
+        # with a preview the game draws on its own part of the window and the
+        # camera frame goes next to it or into a corner
+        self.preview = None
+        if preview is None:
+            self.screen = pygame.display.set_mode(
+                (self.screen_width, self.screen_height)
+            )
+        else:
+            window_size, game_rect, preview_rect = preview_layout(
+                (self.screen_width, self.screen_height),
+                preview_size,
+                layout=preview,
+                scale=preview_scale,
+            )
+            window = pygame.display.set_mode(window_size)
+            self.screen = window.subsurface(game_rect)
+            self.preview = CameraPreview(window, preview_rect)
         self.clock = pygame.time.Clock()
         self.paddle_top = Paddle(
             screen=self.screen,
@@ -218,6 +253,7 @@ class Game:
             radius=self.ball_radius,
             velocity=self.ball_velocity,
             color=self.ball_color,
+            rng=self.rng,
         )
         self.score_top = Score(
             screen=self.screen,
@@ -238,6 +274,10 @@ class Game:
         self.score_top.draw()
         self.score_bottom.draw()
 
+    def draw_preview(self, frame: Any) -> None:
+        if self.preview is not None:
+            self.preview.draw(frame)
+
     def update(self) -> None:
         self.ball.move()
         self.paddle_top.move()
@@ -257,6 +297,51 @@ class Game:
             self.paddle_bottom.reset()
             self.paddle_top.reset()
 
+    def snapshot(self) -> tuple:
+        return (
+            self.paddle_top.paddle.x,
+            self.paddle_top.direction_x,
+            self.paddle_bottom.paddle.x,
+            self.paddle_bottom.direction_x,
+            self.ball.ball.x,
+            self.ball.ball.y,
+            self.ball.direction_x,
+            self.ball.direction_y,
+            self.score_top.score,
+            self.score_bottom.score,
+            self.rng.getstate(),
+        )
+
+    def restore(self, state: tuple) -> None:
+        (
+            self.paddle_top.paddle.x,
+            self.paddle_top.direction_x,
+            self.paddle_bottom.paddle.x,
+            self.paddle_bottom.direction_x,
+            self.ball.ball.x,
+            self.ball.ball.y,
+            self.ball.direction_x,
+            self.ball.direction_y,
+            self.score_top.score,
+            self.score_bottom.score,
+            rng_state,
+        ) = state
+        self.rng.setstate(rng_state)
+
+    def apply_input(self, paddle: Paddle, player_input: Tuple[int, int]) -> None:
+        kind, value = player_input
+        if kind == 0:
+            paddle.direction_x = value
+        else:
+            paddle.stop()
+            paddle.move(value)
+
+    def step(self, inputs: List[Tuple[int, int]]) -> None:
+        # one deterministic tick driven only by the inputs, used by netplay
+        self.apply_input(self.paddle_top, inputs[0])
+        self.apply_input(self.paddle_bottom, inputs[1])
+        self.update()
+
     def control(
         self,
         mode: str = "key",
@@ -301,12 +386,23 @@ class FaceDetection:
         screen_height: int,
         left_color: Tuple[int, int, int],
         right_color: Tuple[int, int, int],
+        source: Any = 0,
+        threaded_capture: bool = True,
     ) -> None:
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.left_color = left_color
         self.right_color = right_color
-        self.cap = cv2.VideoCapture(0)
+        # without threaded_capture a replayed or synthetic source is read in
+        # the loop, every frame exactly once
+        self.cap = LatestFrameCapture(
+            source,
+            width=self.screen_width,
+            height=self.screen_height,
+            threaded=threaded_capture,
+        )
+        self.preprocessor = FramePreprocessor(self.screen_width, self.screen_height)
+        self.frame = self.preprocessor.display
         self.left_roi = {
             "x": 0,
             "y": 0,
@@ -319,31 +415,33 @@ class FaceDetection:
             "w": self.screen_width // 2,
             "h": self.screen_height,
         }
+        self.detections = DetectionBatch.empty()
         self.left_face = None
         self.right_face = None
 
-    def draw(self) -> None:
-        _, self.frame = self.cap.read()
-        self.frame = cv2.flip(self.frame, 1)
-        self.frame = cv2.resize(self.frame, (self.screen_width, self.screen_height))
+    def draw(self, frame_buffer: Union[np.ndarray, None] = None) -> bool:
+        # frame_buffer lets the vision process hand in its shared memory slot,
+        # without a new frame nothing was written to it and nothing is detected
+        ok, frame, model_input, _ = self.preprocessor.read_timestamped(
+            self.cap, frame_buffer
+        )
+        if not ok:
+            return False
+        self.frame = frame
 
-        self.draw_roi()
+        # without a color conversion the model input shares the display buffer,
+        # so detection has to run before anything is drawn on the frame
+        self.detections = detect_faces(model_input, DETECTOR_BACKEND)
 
-        self.results = DeepFace.extract_faces(
-            self.frame, detector_backend="yolov8", enforce_detection=False
-        )
+        self.draw_roi()
 
         self.left_face = self.largest_face_in_roi(self.left_roi)
         self.right_face = self.largest_face_in_roi(self.right_roi)
         self.draw_player()
-
-        cv2.imshow("frame", self.frame)
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            self.close()
+        return True
 
     def close(self) -> None:
         self.cap.release()
-        cv2.destroyAllWindows()
 
     def draw_roi(self) -> None:
         cv2.rectangle(
@@ -391,59 +489,68 @@ class FaceDetection:
     def draw_player(self):
         if self.left_face is not None:
             self.draw_bbox(
-                bbox=self.left_face["facial_area"],
+                bbox=self.detections.box(self.left_face),
                 text="Player 1",
                 color=self.left_color,
             )
         if self.right_face is not None:
             self.draw_bbox(
-                bbox=self.right_face["facial_area"],
+                bbox=self.detections.box(self.right_face),
                 text="Player 2",
                 color=self.right_color,
             )
 
-    def face_in_roi(
-        self,
-        facial_area: Dict[str, int],
-        roi: Dict[str, int],
-    ) -> bool:
-        if (
-            facial_area["x"] >= roi["x"]
-            and facial_area["x"] + facial_area["w"] <= roi["x"] + roi["w"]
-            and facial_area["y"] >= roi["y"]
-            and facial_area["y"] + facial_area["h"] <= roi["y"] + roi["h"]
-        ):
-            return True
-        return False
+    def largest_face_in_roi(self, roi: Dict[str, int]) -> Union[int, None]:
+        return self.detections.largest(self.detections.in_roi(roi))
 
-    def largest_face_in_roi(self, roi: Dict[str, int]):
-        largest_face = None
-        largest_face_area = 0
-        for result in self.results:
-            if self.face_in_roi(result["facial_area"], roi):
-                face_area = result["facial_area"]["w"] * result["facial_area"]["h"]
-                if face_area > largest_face_area:
-                    largest_face = result
-                    largest_face_area = face_area
-        return largest_face
-
-    def to_float(self, facial_area: Dict[str, int], roi: Dict[str, int]) -> float:
-        return (facial_area["x"] - roi["x"] + facial_area["w"] // 2) / (
-            self.screen_width // 2
-        )
+    def to_float(self, face: int, roi: Dict[str, int]) -> float:
+        x, _, w, _ = self.detections.boxes[face]
+        return float(x - roi["x"] + w // 2) / (self.screen_width // 2)
 
     def map_control(self) -> Dict[str, float]:
         control = {"top": 0.5, "bottom": 0.5}
         if self.left_face is not None:
-            control["top"] = self.to_float(self.left_face["facial_area"], self.left_roi)
+            control["top"] = self.to_float(self.left_face, self.left_roi)
         if self.right_face is not None:
-            control["bottom"] = self.to_float(
-                self.right_face["facial_area"], self.right_roi
-            )
+            control["bottom"] = self.to_float(self.right_face, self.right_roi)
         return control
 
 
+def face_detection_worker(
+    stop_event,
+    screen_width: int,
+    screen_height: int,
+    left_color: Tuple[int, int, int],
+    right_color: Tuple[int, int, int],
+    claim_frame: Union[Callable[[], np.ndarray], None] = None,
+):
+    face_detection = FaceDetection(
+        screen_width=screen_width,
+        screen_height=screen_height,
+        left_color=left_color,
+        right_color=right_color,
+    )
+    try:
+        while not stop_event.is_set() and face_detection.cap.isOpened():
+            if not face_detection.draw(claim_frame() if claim_frame else None):
+                continue
+            yield face_detection.frame, face_detection.map_control()
+    finally:
+        face_detection.close()
+
+
 if __name__ == "__main__":
+    # local match by default, or one player per machine over udp, e.g.
+    #   python 6_pong.py --net host --port 5000 --peer 127.0.0.1:5001
+    #   python 6_pong.py --net join --port 5001 --peer 127.0.0.1:5000
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--net", choices=["host", "join"])
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--peer", default="127.0.0.1:5001")
+    parser.add_argument("--control", choices=["key", "face"], default="face")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
     COLOR_WHITE = (255, 255, 255)
     COLOR_RED = (255, 0, 0)
     COLOR_GREEN = (0, 255, 0)
@@ -465,6 +572,16 @@ if __name__ == "__main__":
     FD_LEFT_COLOR = COLOR_BLUE
     FD_RIGHT_COLOR = COLOR_GREEN
 
+    # run face detection in its own process so inference and rendering do not
+    # compete for the GIL, VISION_CPU pins it to a dedicated core
+    USE_VISION_PROCESS = True
+    VISION_CPU = None
+
+    # the annotated camera frame is shown inside the pygame window, "split"
+    # puts it next to the court, "pip" in a corner, None hides it
+    PREVIEW = "split"
+    PREVIEW_SCALE = 0.35
+
     game = Game(
         screen_width=SCREEN_WIDTH,
         screen_height=SCREEN_HEIGHT,
@@ -476,26 +593,112 @@ if __name__ == "__main__":
         ball_color=BALL_COLOR,
         ball_velocity=BALL_VELOCITY,
         score_color=SCORE_COLOR,
+        seed=args.seed,
+        preview=PREVIEW if args.control == "face" else None,
+        preview_size=(FD_SCREEN_WIDTH, FD_SCREEN_HEIGHT),
+        preview_scale=PREVIEW_SCALE,
     )
-    face_detection = FaceDetection(
-        screen_width=FD_SCREEN_WIDTH,
-        screen_height=FD_SCREEN_HEIGHT,
-        left_color=FD_LEFT_COLOR,
-        right_color=FD_RIGHT_COLOR,
-    )
+    if args.control == "face" and USE_VISION_PROCESS:
+        vision = VisionProcess(
+            functools.partial(
+                face_detection_worker,
+                screen_width=FD_SCREEN_WIDTH,
+                screen_height=FD_SCREEN_HEIGHT,
+                left_color=FD_LEFT_COLOR,
+                right_color=FD_RIGHT_COLOR,
+            ),
+            frame_shape=(FD_SCREEN_HEIGHT, FD_SCREEN_WIDTH, 3),
+            cpu=VISION_CPU,
+        )
+        vision.start()
+    elif args.control == "face":
+        face_detection = FaceDetection(
+            screen_width=FD_SCREEN_WIDTH,
+            screen_height=FD_SCREEN_HEIGHT,
+            left_color=FD_LEFT_COLOR,
+            right_color=FD_RIGHT_COLOR,
+        )
+
+    face_coordinate = {"top": 0.5, "bottom": 0.5}
+
+    def draw_camera_frame() -> None:
+        if args.control != "face":
+            return
+        if USE_VISION_PROCESS:
+            # the preview reads the shared slot in place, no copy is made
+            vision.read_frame(game.draw_preview)
+        else:
+            game.draw_preview(face_detection.frame)
+
+    def shutdown() -> None:
+        if args.control == "face" and USE_VISION_PROCESS:
+            vision.close()
+        elif args.control == "face":
+            face_detection.close()
+        pygame.quit()
+        exit()
+
+    if args.net is not None:
+        # the host plays the top paddle, inputs are predicted and rolled back
+        # so the local paddle never waits for the network
+        local_player = 0 if args.net == "host" else 1
+        session = RollbackSession(
+            game, local_player, args.port, parse_address(args.peer)
+        )
+        while True:
+            for event in pygame.event.get():
+                if quit_requested(event):
+                    session.close()
+                    shutdown()
+
+            if args.control == "key":
+                pressed = pygame.key.get_pressed()
+                local_input = (
+                    0,
+                    int(pressed[pygame.K_RIGHT] or pressed[pygame.K_d])
+                    - int(pressed[pygame.K_LEFT] or pressed[pygame.K_a]),
+                )
+            else:
+                if USE_VISION_PROCESS:
+                    controls = vision.poll()
+                    if controls:
+                        face_coordinate = controls[-1]
+                else:
+                    face_detection.draw()
+                    face_coordinate = face_detection.map_control()
+                position = face_coordinate["top" if local_player == 0 else "bottom"]
+                local_input = (1, int(SCREEN_WIDTH * position))
+
+            session.advance(local_input)
+            game.draw()
+            draw_camera_frame()
+            pygame.display.update()
+            game.clock.tick(30)
 
     while True:
         game.draw()
-        face_detection.draw()
+
+        events = pygame.event.get()
+        if any(quit_requested(event) for event in events):
+            shutdown()
 
         # key control mode
-        # for event in pygame.event.get():
-        #     game.control(mode="key", event=event)
+        if args.control == "key":
+            for event in events:
+                game.control(mode="key", event=event)
 
         # face control mode
-        face_coordinate = face_detection.map_control()
-        game.control(mode="face", face_coordinate=face_coordinate)
+        else:
+            if USE_VISION_PROCESS:
+                controls = vision.poll()
+                if controls:
+                    face_coordinate = controls[-1]
+            else:
+                face_detection.draw()
+                face_coordinate = face_detection.map_control()
+            game.control(mode="face", face_coordinate=face_coordinate)
 
         game.update()
+        draw_camera_frame()
         pygame.display.update()
         game.clock.tick(30)
@@ -1,30 +1,57 @@
 import cv2
+import functools
 import mediapipe as mp
+import numpy as np
 import pygame
 import random
-from typing import Union, Dict, List
+import time
+from typing import Any, Callable, Union, Dict, List, Tuple
+
+from helpers.capture import LatestFrameCapture
+from helpers.filters import CursorFilter, PointInterpolator
+from helpers.isolation import VisionProcess, VisionThread
+from helpers.preprocess import FramePreprocessor
+from helpers.preview import CameraPreview, preview_layout, quit_requested
 
 
 class HandEvent:
-    def __init__(self, click: bool, x: float, y: float) -> None:
+    def __init__(
+        self, click: bool, x: float, y: float, timestamp: Union[float, None] = None
+    ) -> None:
         self.click = click
         self.x = x
         self.y = y
+        # moment the position refers to: the capture time of its frame plus
+        # the lead the cursor filter projected it by, on the perf_counter
+        # clock, which is shared by every process on the machine
+        self.timestamp = timestamp
 
 
 class HandEventMotion(HandEvent):
-    def __init__(self, click: bool, x: float, y: float) -> None:
-        super().__init__(click, x, y)
+    def __init__(
+        self, click: bool, x: float, y: float, timestamp: Union[float, None] = None
+    ) -> None:
+        super().__init__(click, x, y, timestamp)
 
 
 class HandEventDown(HandEvent):
-    def __init__(self, click: bool, x: float, y: float) -> None:
-        super().__init__(click, x, y)
+    def __init__(
+        self, click: bool, x: float, y: float, timestamp: Union[float, None] = None
+    ) -> None:
+        super().__init__(click, x, y, timestamp)
 
 
 class HandEventUp(HandEvent):
-    def __init__(self, click: bool, x: float, y: float) -> None:
-        super().__init__(click, x, y)
+    def __init__(
+        self, click: bool, x: float, y: float, timestamp: Union[float, None] = None
+    ) -> None:
+        super().__init__(click, x, y, timestamp)
+
+
+HAND_EVENTS = {
+    event_class.__name__: event_class
+    for event_class in (HandEventMotion, HandEventDown, HandEventUp)
+}
 
 
 class Block:
@@ -123,20 +150,51 @@ class Cursor:
 
 
 class Playground:
-    def __init__(self, screen_width: int, screen_height: int) -> None:
+    def __init__(
+        self,
+        screen_width: int,
+        screen_height: int,
+        preview: Union[str, None] = None,
+        preview_size: Tuple[int, int] = (1280, 720),
+        preview_scale: float = 0.25,
+        interpolator: Union[PointInterpolator, None] = None,
+    ) -> None:
         pygame.init()
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.clock = pygame.time.Clock()
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
+        # with a preview the playground draws on its own part of the window
+        # and the camera frame goes next to it or into a corner
+        self.preview = None
+        if preview is None:
+            self.screen = pygame.display.set_mode(
+                (self.screen_width, self.screen_height)
+            )
+        else:
+            window_size, playground_rect, preview_rect = preview_layout(
+                (self.screen_width, self.screen_height),
+                preview_size,
+                layout=preview,
+                scale=preview_scale,
+            )
+            window = pygame.display.set_mode(window_size)
+            self.screen = window.subsurface(playground_rect)
+            self.preview = CameraPreview(window, preview_rect)
         self.block_controller = BlockController(self.screen)
         self.cursor = Cursor(self.screen, 0, 0)
+        # with an interpolator timestamped hand events are buffered and
+        # update() moves the cursor on every rendered frame
+        self.interpolator = interpolator
 
     def draw(self) -> None:
         self.screen.fill((0, 0, 0))
         self.block_controller.draw()
         self.cursor.draw()
 
+    def draw_preview(self, frame: Any) -> None:
+        if self.preview is not None:
+            self.preview.draw(frame)
+
     def control(
         self,
         mode: str = "key",
@@ -176,6 +234,35 @@ class Playground:
 
     def _control_hand(
         self, event: Union[HandEventMotion, HandEventDown, HandEventUp]
+    ) -> None:
+        if self.interpolator is None or event.timestamp is None:
+            self._apply_hand(event)
+            return
+        self.interpolator.add(event.x, event.y, event.timestamp)
+        if type(event) == HandEventMotion:
+            return
+        # presses and releases are not delayed, they act at the drawn cursor,
+        # so a grab hits the block under it and the block does not jump on
+        # the next update, a release drops the block where it is drawn
+        x, y = self.interpolator()
+        if type(event) == HandEventUp:
+            self._apply_hand(HandEventMotion(event.click, x, y))
+        self._apply_hand(type(event)(event.click, x, y))
+
+    def update(self, now: Union[float, None] = None) -> None:
+        if self.interpolator is None:
+            return
+        if now is None:
+            now = time.perf_counter()
+        position = self.interpolator(now)
+        if position is not None:
+            cursor_x = int(position[0] * self.screen_width)
+            cursor_y = int(position[1] * self.screen_height)
+            self.cursor.move(cursor_x, cursor_y)
+            self.block_controller.drag(cursor_x, cursor_y)
+
+    def _apply_hand(
+        self, event: Union[HandEventMotion, HandEventDown, HandEventUp]
     ) -> None:
         cursor_x = int(event.x * self.screen_width)
         cursor_y = int(event.y * self.screen_height)
@@ -201,10 +288,29 @@ class Playground:
 
 
 class HandTracking:
-    def __init__(self, screen_width: int, screen_height: int) -> None:
+    def __init__(
+        self,
+        screen_width: int,
+        screen_height: int,
+        cursor_filter: Union[CursorFilter, None] = None,
+        source: Any = 0,
+        threaded_capture: bool = True,
+    ) -> None:
         self.screen_width = screen_width
         self.screen_height = screen_height
-        self.cap = cv2.VideoCapture(0)
+        # without threaded_capture a replayed or synthetic source is read in
+        # the loop, every frame exactly once
+        self.cap = LatestFrameCapture(
+            source,
+            width=self.screen_width,
+            height=self.screen_height,
+            threaded=threaded_capture,
+        )
+        self.preprocessor = FramePreprocessor(
+            self.screen_width,
+            self.screen_height,
+            color_conversion=cv2.COLOR_BGR2RGB,
+        )
         self.mp_hands = mp.solutions.hands  # type: ignore
         self.mp_draw = mp.solutions.drawing_utils  # type: ignore
         self.hands = self.mp_hands.Hands(
@@ -216,14 +322,26 @@ class HandTracking:
         self.click = False
         self.cursor_x = 0
         self.cursor_y = 0
+        self.cursor_filter = cursor_filter if cursor_filter else CursorFilter()
+        self.frame_time = time.perf_counter()
+        self.cursor_time = self.frame_time
+
+    def draw(self, hands, frame_buffer: Union[np.ndarray, None] = None) -> bool:
+        # the preprocessor keeps the BGR display frame and the RGB model input
+        # side by side, so no conversion back to BGR is needed after inference,
+        # frame_buffer lets the vision process hand in its shared memory slot.
+        # latency is measured from the moment the frame left the camera, so the
+        # timestamp is read together with the frame it belongs to. without a
+        # new frame nothing was written to frame_buffer and nothing is tracked
+        ok, frame, model_input, frame_time = self.preprocessor.read_timestamped(
+            self.cap, frame_buffer
+        )
+        if not ok:
+            return False
+        self.frame = frame
+        self.frame_time = frame_time
 
-    def draw(self, hands) -> None:
-        _, self.frame = self.cap.read()
-        self.frame = cv2.cvtColor(cv2.flip(self.frame, 1), cv2.COLOR_BGR2RGB)
-        self.frame = cv2.resize(self.frame, (self.screen_width, self.screen_height))
-
-        self.results = hands.process(self.frame)
-        self.frame = cv2.cvtColor(self.frame, cv2.COLOR_RGB2BGR)
+        self.results = hands.process(model_input)
 
         self._draw_annotation()
         self.multi_hand_landmarks_processed = self._preprocess_landmarks()
@@ -231,14 +349,11 @@ class HandTracking:
             self.multi_hand_landmarks_processed
         )
         self._draw_cursor(self.palm_coordinates, self.multi_hand_landmarks_processed)
-
-        cv2.imshow("frame", self.frame)
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            self.close()
+        self._draw_filter_stats()
+        return True
 
     def close(self) -> None:
         self.cap.release()
-        cv2.destroyAllWindows()
 
     def _draw_annotation(self) -> None:
         if self.results.multi_hand_landmarks:
@@ -272,6 +387,22 @@ class HandTracking:
                         cv2.FILLED,
                     )
 
+    def _draw_filter_stats(self) -> None:
+        stats = self.cursor_filter.stats()
+        cv2.putText(
+            img=self.frame,
+            text=(
+                f"latency {stats['latency_ms']:.0f}ms "
+                f"jitter {stats['raw_jitter']:.4f} -> {stats['filtered_jitter']:.4f}"
+            ),
+            org=(10, 30),
+            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+            fontScale=0.7,
+            color=(0, 255, 0),
+            thickness=2,
+            lineType=cv2.LINE_AA,
+        )
+
     def _preprocess_landmarks(self) -> List[List[Dict[str, Union[int, float]]]]:
         if not self.results.multi_hand_landmarks:
             return []
@@ -333,11 +464,11 @@ class HandTracking:
             return True
         return False
 
-    def _cursor_easing(
-        self, cursor_x: float, cursor_y: float, easing: float = 0.5
-    ) -> None:
-        self.cursor_x += (cursor_x - self.cursor_x) * easing
-        self.cursor_y += (cursor_y - self.cursor_y) * easing
+    def _cursor_filtering(self, cursor_x: float, cursor_y: float) -> None:
+        self.cursor_x, self.cursor_y = self.cursor_filter(
+            cursor_x, cursor_y, self.frame_time
+        )
+        self.cursor_time = self.frame_time + self.cursor_filter.lead
 
     def event(self) -> List[Union[HandEventMotion, HandEventDown, HandEventUp]]:
         hand_events = []
@@ -345,7 +476,7 @@ class HandTracking:
         for palm_coordinate, hand_landmarks in zip(
             self.palm_coordinates, self.multi_hand_landmarks_processed
         ):
-            self._cursor_easing(
+            self._cursor_filtering(
                 palm_coordinate["x"] / self.screen_width,
                 palm_coordinate["y"] / self.screen_height,
             )
@@ -354,36 +485,124 @@ class HandTracking:
 
             if self.click == self._is_pinch(hand_landmarks):
                 hand_events.append(
-                    HandEventMotion(click=self.click, x=cursor_x, y=cursor_y)
+                    HandEventMotion(
+                        click=self.click,
+                        x=cursor_x,
+                        y=cursor_y,
+                        timestamp=self.cursor_time,
+                    )
                 )
             elif not self.click:
                 self.click = self._is_pinch(hand_landmarks)
                 hand_events.append(
-                    HandEventDown(click=self.click, x=cursor_x, y=cursor_y)
+                    HandEventDown(
+                        click=self.click,
+                        x=cursor_x,
+                        y=cursor_y,
+                        timestamp=self.cursor_time,
+                    )
                 )
             elif self.click:
                 self.click = self._is_pinch(hand_landmarks)
                 hand_events.append(
-                    HandEventUp(click=self.click, x=cursor_x, y=cursor_y)
+                    HandEventUp(
+                        click=self.click,
+                        x=cursor_x,
+                        y=cursor_y,
+                        timestamp=self.cursor_time,
+                    )
                 )
 
         return hand_events
 
 
-if __name__ == "__main__":
-    playground = Playground(1280, 720)
-    hand_tracking = HandTracking(playground.screen_width, playground.screen_height)
-
-    with hand_tracking.hands as hands:
-        while True:
-            playground.draw()
-            hand_tracking.draw(hands)
+def hand_tracking_worker(
+    stop_event,
+    screen_width: int,
+    screen_height: int,
+    claim_frame: Union[Callable[[], np.ndarray], None] = None,
+):
+    hand_tracking = HandTracking(screen_width, screen_height)
+    try:
+        with hand_tracking.hands as hands:
+            while not stop_event.is_set() and hand_tracking.cap.isOpened():
+                if not hand_tracking.draw(
+                    hands, claim_frame() if claim_frame else None
+                ):
+                    continue
+                # events travel as plain tuples, rebuilt with HAND_EVENTS
+                events = [
+                    (
+                        type(event).__name__,
+                        event.click,
+                        event.x,
+                        event.y,
+                        event.timestamp,
+                    )
+                    for event in hand_tracking.event()
+                ]
+                yield hand_tracking.frame, events
+    finally:
+        hand_tracking.close()
 
-            # for event in pygame.event.get():
-            #     playground.control(mode="mouse", event=event)
 
-            for event in hand_tracking.event():
-                playground.control(mode="hand", hand_event=event)
+if __name__ == "__main__":
+    # run hand tracking in its own process so mediapipe and the playground do
+    # not compete for the GIL, VISION_CPU pins it to a dedicated core,
+    # without it tracking runs in a thread of the playground process
+    USE_VISION_PROCESS = True
+    VISION_CPU = None
+
+    # the annotated camera frame is shown inside the pygame window, "pip"
+    # puts it into a corner, "split" next to the playground, None hides it
+    PREVIEW = "pip"
+    PREVIEW_SCALE = 0.25
+
+    # the playground renders on its own clock, tracking only delivers samples
+    # that the cursor and the dragged block are interpolated between,
+    # INTERPOLATION_DELAY None adapts to the tracking rate and latency
+    RENDER_FPS = 60
+    INTERPOLATION_DELAY = None
+
+    playground = Playground(
+        1280,
+        720,
+        preview=PREVIEW,
+        preview_scale=PREVIEW_SCALE,
+        interpolator=PointInterpolator(delay=INTERPOLATION_DELAY),
+    )
+
+    worker = functools.partial(
+        hand_tracking_worker,
+        screen_width=playground.screen_width,
+        screen_height=playground.screen_height,
+    )
+    if USE_VISION_PROCESS:
+        vision = VisionProcess(
+            worker,
+            frame_shape=(playground.screen_height, playground.screen_width, 3),
+            cpu=VISION_CPU,
+        )
+    else:
+        vision = VisionThread(worker)
+    vision.start()
+
+    while True:
+        if any(quit_requested(event) for event in pygame.event.get()):
+            vision.close()
+            pygame.quit()
+            exit()
+
+        for events in vision.poll():
+            for name, click, x, y, timestamp in events:
+                playground.control(
+                    mode="hand",
+                    hand_event=HAND_EVENTS[name](click, x, y, timestamp),
+                )
 
-            pygame.display.update()
-            playground.clock.tick(20)
+        playground.update()
+        playground.draw()
+        # the preview reads the shared slot in place, no copy is made
+        vision.read_frame(playground.draw_preview)
+        pygame.display.update()
+        playground.clock.tick(RENDER_FPS)
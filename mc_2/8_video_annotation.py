@@ -0,0 +1,19 @@
+from helpers.offline import VideoAnnotator
+
+if __name__ == "__main__":
+    path_video = "videos/input.mp4"
+    path_output = "videos/output.mp4"
+    path_results = "videos/output.jsonl"
+
+    # "detection" draws face boxes, "emotion" draws the dominant emotion
+    annotator = VideoAnnotator(
+        mode="emotion",
+        chunk_seconds=10.0,
+    )
+    stats = annotator.process(path_video, path_output, path_results)
+
+    print(
+        f"{stats['frames']} frames in {stats['chunks']} chunks, "
+        f"{stats['duration']:.1f}s of video in {stats['elapsed']:.1f}s "
+        f"({stats['realtime_factor']:.1f}x realtime)"
+    )
@@ -0,0 +1,29 @@
+from helpers.backend import save_detector_backend
+from helpers.benchmark import benchmark_backends, select_backend
+
+if __name__ == "__main__":
+    image_dir = "images"
+    min_recall = 0.9
+
+    reports = benchmark_backends(image_dir, repeats=3)
+
+    for report in reports:
+        if "error" in report:
+            print(f"{report['backend']:<12} unavailable: {report['error']}")
+            continue
+        print(
+            f"{report['backend']:<12} "
+            f"{report['latency_per_image'] * 1000:8.1f} ms/image "
+            f"{report['latency_per_face'] * 1000:8.1f} ms/face "
+            f"{report['memory_mb']:8.1f} MB "
+            f"recall {report['recall']:.2f} "
+            f"precision {report['precision']:.2f}"
+        )
+
+    # the fastest backend that still finds enough faces becomes the default
+    best = select_backend(reports, min_recall=min_recall)
+    if best is None:
+        print(f"No backend reached a recall of {min_recall}")
+    else:
+        save_detector_backend(best["backend"], best)
+        print(f"Default detector backend set to {best['backend']}")
@@ -0,0 +1,22 @@
+import json
+import os
+from typing import Any, Dict, Union
+
+BACKEND_CONFIG = os.path.join(os.path.dirname(__file__), "detector_backend.json")
+
+
+def load_detector_backend(default: str = "yolov8") -> str:
+    if not os.path.exists(BACKEND_CONFIG):
+        return default
+    with open(BACKEND_CONFIG) as config_file:
+        return json.load(config_file).get("detector_backend", default)
+
+
+def save_detector_backend(
+    backend: str, report: Union[Dict[str, Any], None] = None
+) -> None:
+    with open(BACKEND_CONFIG, "w") as config_file:
+        json.dump({"detector_backend": backend, "report": report}, config_file, indent=2)
+
+
+DETECTOR_BACKEND = load_detector_backend()
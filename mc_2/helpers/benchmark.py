@@ -0,0 +1,171 @@
+import importlib.util
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+from helpers.tracking import greedy_match, iou_matrix
+
+# python module each deepface detector backend needs at runtime
+BACKEND_MODULES = {
+    "opencv": "cv2",
+    "ssd": "cv2",
+    "yunet": "cv2",
+    "dlib": "dlib",
+    "mtcnn": "mtcnn",
+    "fastmtcnn": "facenet_pytorch",
+    "retinaface": "retinaface",
+    "mediapipe": "mediapipe",
+    "yolov8": "ultralytics",
+}
+
+
+def available_backends() -> List[str]:
+    return [
+        backend
+        for backend, module in BACKEND_MODULES.items()
+        if importlib.util.find_spec(module) is not None
+    ]
+
+
+def load_labels(
+    image_dir: str, labels_path: Union[str, None] = None
+) -> Dict[str, np.ndarray]:
+    # every image maps to its ground truth faces as x, y, w, h boxes
+    if labels_path is None:
+        labels_path = os.path.join(image_dir, "labels.json")
+    with open(labels_path) as labels_file:
+        labels = json.load(labels_file)
+    for name, boxes in labels.items():
+        if not isinstance(boxes, list):
+            raise ValueError(f"{name} needs a list of x, y, w, h face boxes")
+    return {
+        name: np.array(boxes, dtype=np.int32).reshape(-1, 4)
+        for name, boxes in labels.items()
+    }
+
+
+def match_faces(
+    detected: np.ndarray, expected: np.ndarray, iou_threshold: float
+) -> int:
+    # a detection only counts when it overlaps a ground truth face that no
+    # other detection has taken, false positives elsewhere never count
+    rows, _ = greedy_match(iou_matrix(detected, expected), iou_threshold)
+    return len(rows)
+
+
+def _peak_memory_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos reports bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _run_backend(
+    backend: str,
+    image_dir: str,
+    labels: Dict[str, np.ndarray],
+    repeats: int,
+    iou_threshold: float,
+) -> Dict[str, Any]:
+    import cv2
+    from deepface import DeepFace
+
+    images = {name: cv2.imread(os.path.join(image_dir, name)) for name in labels}
+    baseline_memory = _peak_memory_mb()
+
+    try:
+        # the first call downloads and builds the model, keep it out of the timings
+        start = time.perf_counter()
+        DeepFace.extract_faces(
+            next(iter(images.values())),
+            detector_backend=backend,
+            enforce_detection=False,
+        )
+        load_time = time.perf_counter() - start
+
+        latencies = []
+        detected = 0
+        matched = 0
+        for name, image in images.items():
+            for _ in range(repeats):
+                start = time.perf_counter()
+                faces = DeepFace.extract_faces(
+                    image, detector_backend=backend, enforce_detection=False
+                )
+                latencies.append(time.perf_counter() - start)
+
+            # with enforce_detection disabled a miss comes back as the whole
+            # image with zero confidence
+            boxes = np.array(
+                [
+                    [face["facial_area"][key] for key in ("x", "y", "w", "h")]
+                    for face in faces
+                    if face["confidence"] > 0
+                ],
+                dtype=np.int32,
+            ).reshape(-1, 4)
+            detected += len(boxes)
+            matched += match_faces(boxes, labels[name], iou_threshold)
+    except Exception as error:
+        return {"backend": backend, "error": str(error)}
+
+    total_time = sum(latencies) / repeats
+    expected = sum(len(boxes) for boxes in labels.values())
+    return {
+        "backend": backend,
+        "load_time": load_time,
+        "latency_per_image": sum(latencies) / len(latencies),
+        "latency_per_face": total_time / detected if detected else float("inf"),
+        "memory_mb": _peak_memory_mb() - baseline_memory,
+        "detected": detected,
+        "expected": expected,
+        "matched": matched,
+        "recall": matched / expected if expected else 0.0,
+        "precision": matched / detected if detected else 0.0,
+    }
+
+
+def benchmark_backends(
+    image_dir: str,
+    backends: Union[List[str], None] = None,
+    labels_path: Union[str, None] = None,
+    repeats: int = 3,
+    iou_threshold: float = 0.4,
+) -> List[Dict[str, Any]]:
+    # detectors draw face boxes with different margins around the same face,
+    # so the overlap needed for a match is below the usual 0.5
+    if backends is None:
+        backends = available_backends()
+    labels = load_labels(image_dir, labels_path)
+
+    reports = []
+    for backend in backends:
+        # a fresh process per backend keeps model memory and warm caches apart
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            reports.append(
+                executor.submit(
+                    _run_backend, backend, image_dir, labels, repeats, iou_threshold
+                ).result()
+            )
+    return reports
+
+
+def select_backend(
+    reports: List[Dict[str, Any]], min_recall: float = 0.9
+) -> Union[Dict[str, Any], None]:
+    candidates = [
+        report
+        for report in reports
+        if "error" not in report and report["recall"] >= min_recall
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda report: report["latency_per_image"])
@@ -0,0 +1,250 @@
+import threading
+import time
+from typing import Any, Dict, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class SyntheticSource:
+    def __init__(
+        self,
+        width: int = 640,
+        height: int = 480,
+        fps: float = 30.0,
+        frames: Union[int, None] = None,
+        realtime: bool = True,
+    ) -> None:
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames
+        self.realtime = realtime
+        self.index = 0
+        self.opened = True
+        self.started = time.perf_counter()
+        gradient = np.linspace(0, 255, width, dtype=np.uint8)
+        self.background = np.repeat(
+            np.broadcast_to(gradient, (height, width))[:, :, None], 3, axis=2
+        )
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def read(self, image: Union[np.ndarray, None] = None) -> Tuple[bool, Any]:
+        if not self.opened or (self.frames is not None and self.index >= self.frames):
+            return False, None
+        if self.realtime:
+            delay = self.started + self.index / self.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        # a square moving on a circle, so motion and frame order are visible
+        frame = self.background.copy()
+        angle = self.index / self.fps
+        size = min(self.width, self.height) // 4
+        x = int((self.width - size) / 2 * (1 + 0.8 * np.cos(angle)))
+        y = int((self.height - size) / 2 * (1 + 0.8 * np.sin(angle)))
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (0, 0, 255), cv2.FILLED)
+        self.index += 1
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        values = {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self.frames if self.frames else -1,
+            cv2.CAP_PROP_POS_FRAMES: self.index,
+        }
+        return float(values.get(prop, 0))
+
+    def set(self, prop: int, value: float) -> bool:
+        return False
+
+    def release(self) -> None:
+        self.opened = False
+
+
+class ReplaySource:
+    def __init__(self, path: str, loops: Union[int, None] = None) -> None:
+        # a video file that starts over at the end, for runs longer than it
+        self.cap = cv2.VideoCapture(path)
+        self.loops = loops
+        self.loop = 0
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def read(self, image: Union[np.ndarray, None] = None) -> Tuple[bool, Any]:
+        ok, frame = self.cap.read()
+        if not ok and (self.loops is None or self.loop + 1 < self.loops):
+            self.loop += 1
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return ok, frame
+
+    def get(self, prop: int) -> float:
+        return self.cap.get(prop)
+
+    def set(self, prop: int, value: float) -> bool:
+        return False
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class LatestFrameCapture:
+    def __init__(
+        self,
+        source: Any = 0,
+        width: Union[int, None] = None,
+        height: Union[int, None] = None,
+        fps: Union[float, None] = None,
+        fourcc: Union[str, None] = "MJPG",
+        realtime: Union[bool, None] = None,
+        threaded: bool = True,
+    ) -> None:
+        if isinstance(source, (int, str)):
+            self.cap = cv2.VideoCapture(source)
+        else:
+            self.cap = source
+        self.is_file = isinstance(source, str)
+        # files are paced at their own frame rate unless told otherwise
+        self.realtime = self.is_file if realtime is None else realtime
+
+        self._negotiate(width, height, fps, fourcc)
+
+        self.frame = None
+        self.timestamp = 0.0
+        self.sequence = -1
+        self.read_sequence = -1
+        self.captured = 0
+        self.dropped = 0
+        self.running = self.cap.isOpened()
+        self.condition = threading.Condition()
+        # without the drain thread every read pulls the next frame from the
+        # source itself, nothing is dropped, e.g. to replay a recording
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self._drain, daemon=True)
+            self.thread.start()
+
+    def _negotiate(
+        self,
+        width: Union[int, None],
+        height: Union[int, None],
+        fps: Union[float, None],
+        fourcc: Union[str, None],
+    ) -> None:
+        # ask the device for the final format up front, so frames need no
+        # resize afterwards, and keep the driver queue as short as possible
+        if not self.is_file:
+            if fourcc is not None:
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+            if width is not None:
+                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            if height is not None:
+                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            if fps is not None:
+                self.cap.set(cv2.CAP_PROP_FPS, fps)
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.negotiated = {
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": self.cap.get(cv2.CAP_PROP_FPS),
+        }
+
+    def _drain(self) -> None:
+        interval = 1.0 / self.negotiated["fps"] if self.negotiated["fps"] > 0 else 0
+        next_time = time.perf_counter()
+        while self.running:
+            ok, frame = self.cap.read()
+            timestamp = time.perf_counter()
+            with self.condition:
+                if not self.running:
+                    break
+                if not ok:
+                    self.running = False
+                else:
+                    if self.sequence > self.read_sequence:
+                        self.dropped += 1
+                    self.frame = frame
+                    self.timestamp = timestamp
+                    self.sequence += 1
+                    self.captured += 1
+                self.condition.notify_all()
+
+            if self.realtime and interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def isOpened(self) -> bool:
+        return self.running or self.sequence > self.read_sequence
+
+    def read_timestamped(
+        self, timeout: Union[float, None] = None
+    ) -> Tuple[bool, Union[np.ndarray, None], float]:
+        # waits for a frame newer than the last one returned, then hands out
+        # the newest frame only, older ones are dropped. like
+        # cv2.VideoCapture.read it blocks while the device is open, a slow
+        # first frame is not a failure
+        if self.thread is None:
+            return self._read_next()
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.sequence > self.read_sequence or not self.running,
+                timeout=timeout,
+            )
+            if self.sequence <= self.read_sequence:
+                return False, None, self.timestamp
+            self.read_sequence = self.sequence
+            return True, self.frame, self.timestamp
+
+    def _read_next(self) -> Tuple[bool, Union[np.ndarray, None], float]:
+        if not self.running:
+            return False, None, self.timestamp
+        ok, frame = self.cap.read()
+        if not ok:
+            self.running = False
+            return False, None, self.timestamp
+        self.frame = frame
+        self.timestamp = time.perf_counter()
+        self.sequence += 1
+        self.read_sequence = self.sequence
+        self.captured += 1
+        return True, frame, self.timestamp
+
+    def read(self, image: Union[np.ndarray, None] = None) -> Tuple[bool, Any]:
+        ok, frame, _ = self.read_timestamped()
+        # same contract as cv2.VideoCapture.read, a matching image is filled
+        if ok and image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return ok, image
+        return ok, frame
+
+    def frame_age(self) -> float:
+        return time.perf_counter() - self.timestamp
+
+    def get(self, prop: int) -> float:
+        return self.cap.get(prop)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.negotiated,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "frame_age_ms": self.frame_age() * 1000,
+        }
+
+    def release(self) -> None:
+        with self.condition:
+            self.running = False
+            # wake a reader that is still waiting for a frame
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.cap.release()
@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Sequence, Union
+
+import numpy as np
+
+Roi = Union[Dict[str, int], Sequence[int]]
+
+LANDMARK_KEYS = ("left_eye", "right_eye")
+
+
+def _roi_bounds(roi: Roi) -> np.ndarray:
+    if isinstance(roi, dict):
+        return np.array([roi["x"], roi["y"], roi["w"], roi["h"]])
+    return np.asarray(roi)
+
+
+class DetectionBatch:
+    __slots__ = ("boxes", "confidences", "landmarks", "labels")
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        confidences: Union[np.ndarray, None] = None,
+        landmarks: Union[np.ndarray, None] = None,
+        labels: Union[List[str], None] = None,
+    ) -> None:
+        # boxes are (N, 4) integer rows of x, y, w, h in frame pixels
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        if confidences is None:
+            confidences = np.ones(len(self.boxes), dtype=np.float32)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        # landmarks are (N, K, 2) points, nan where the detector gave none
+        self.landmarks = landmarks
+        self.labels = labels
+
+    @classmethod
+    def empty(cls) -> "DetectionBatch":
+        return cls(np.empty((0, 4), dtype=np.int32))
+
+    @classmethod
+    def from_deepface(cls, results: List[Dict[str, Any]]) -> "DetectionBatch":
+        if not results:
+            return cls.empty()
+
+        # extract_faces reports "facial_area", analyze reports "region"
+        key = "facial_area" if "facial_area" in results[0] else "region"
+        areas = [result[key] for result in results]
+        boxes = np.array(
+            [[area["x"], area["y"], area["w"], area["h"]] for area in areas],
+            dtype=np.int32,
+        )
+        confidences = np.array(
+            [
+                result.get("confidence", result.get("face_confidence", 1.0))
+                for result in results
+            ],
+            dtype=np.float32,
+        )
+
+        landmarks = None
+        if any(area.get(name) is not None for area in areas for name in LANDMARK_KEYS):
+            landmarks = np.full((len(areas), len(LANDMARK_KEYS), 2), np.nan)
+            for i, area in enumerate(areas):
+                for j, name in enumerate(LANDMARK_KEYS):
+                    if area.get(name) is not None:
+                        landmarks[i, j] = area[name]
+
+        labels = None
+        if "dominant_emotion" in results[0]:
+            labels = [result["dominant_emotion"] for result in results]
+
+        return cls(boxes, confidences, landmarks, labels)
+
+    @classmethod
+    def concatenate(cls, batches: List["DetectionBatch"]) -> "DetectionBatch":
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+
+        landmarks = None
+        if any(batch.landmarks is not None for batch in batches):
+            shape = next(b.landmarks for b in batches if b.landmarks is not None).shape
+            landmarks = np.concatenate(
+                [
+                    (
+                        batch.landmarks
+                        if batch.landmarks is not None
+                        else np.full((len(batch),) + shape[1:], np.nan)
+                    )
+                    for batch in batches
+                ]
+            )
+
+        labels = None
+        if all(batch.labels is not None for batch in batches):
+            labels = [label for batch in batches for label in batch.labels]
+
+        return cls(
+            np.concatenate([batch.boxes for batch in batches]),
+            np.concatenate([batch.confidences for batch in batches]),
+            landmarks,
+            labels,
+        )
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __getitem__(self, index: Union[int, slice, np.ndarray]) -> "DetectionBatch":
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1)
+        labels = None
+        if self.labels is not None:
+            labels = list(np.asarray(self.labels, dtype=object)[index])
+        return DetectionBatch(
+            self.boxes[index],
+            self.confidences[index],
+            None if self.landmarks is None else self.landmarks[index],
+            labels,
+        )
+
+    def box(self, index: int) -> Dict[str, int]:
+        x, y, w, h = self.boxes[index]
+        return {"x": int(x), "y": int(y), "w": int(w), "h": int(h)}
+
+    def areas(self) -> np.ndarray:
+        return self.boxes[:, 2] * self.boxes[:, 3]
+
+    def centers(self) -> np.ndarray:
+        return self.boxes[:, :2] + self.boxes[:, 2:] / 2
+
+    def in_roi(self, roi: Roi) -> np.ndarray:
+        rx, ry, rw, rh = _roi_bounds(roi)
+        x, y, w, h = self.boxes.T
+        return (x >= rx) & (x + w <= rx + rw) & (y >= ry) & (y + h <= ry + rh)
+
+    def largest(self, mask: Union[np.ndarray, None] = None) -> Union[int, None]:
+        areas = self.areas()
+        if mask is not None:
+            areas = np.where(mask, areas, 0)
+        if not len(areas) or areas.max() <= 0:
+            return None
+        return int(areas.argmax())
+
+    def normalized(self, width: float, height: float) -> np.ndarray:
+        return self.boxes / np.array([width, height, width, height], dtype=np.float32)
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from helpers.detections import DetectionBatch
+
 
 def _crop_face(frame, x, y, w, h, padding=0.0, crop_size=None):
     face_width = w
@@ -34,7 +36,31 @@ def _draw_bbox(frame, x, y, w, h):
     )  # draw box to main image
 
 
+def _draw_label(frame, x, y, text):
+    cv2.putText(
+        frame,
+        text,
+        (x + 5, y - 5),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1,
+        (0, 255, 0),
+        2,
+    )
+
+
+def draw_detections(frame, detections, texts=None):
+    for i, (x, y, w, h) in enumerate(detections.boxes.tolist()):
+        _draw_bbox(frame, x, y, w, h)
+        if texts is not None:
+            _draw_label(frame, x, y, texts[i])
+
+
 def draw_bbox_face_detection(frame, face_object):
+    if isinstance(face_object, DetectionBatch):
+        texts = [f"{confidence*100:.2f}%" for confidence in face_object.confidences]
+        draw_detections(frame, face_object, texts)
+        return
+
     x = face_object["facial_area"]["x"]
     y = face_object["facial_area"]["y"]
     w = face_object["facial_area"]["w"]
@@ -88,6 +114,10 @@ def draw_verification_result(img1, img2, result):
 
 
 def draw_emotion(frame, face_object):
+    if isinstance(face_object, DetectionBatch):
+        draw_detections(frame, face_object, face_object.labels)
+        return
+
     x = face_object["region"]["x"]
     y = face_object["region"]["y"]
     w = face_object["region"]["w"]
@@ -0,0 +1,410 @@
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from helpers.detections import DetectionBatch
+
+ENGINE_CONFIG = os.path.join(os.path.dirname(__file__), "engine.json")
+ENGINE_DIR = os.path.join(os.path.dirname(__file__), "engines")
+ENGINES = ("tensorflow", "onnxruntime", "openvino")
+
+YOLO_SIZE = 640
+YOLO_WEIGHTS = "yolov8n-face.pt"
+
+
+def load_engine_config() -> Dict[str, Any]:
+    config = {"engine": "tensorflow", "threads": 0, "quantized": False}
+    if os.path.exists(ENGINE_CONFIG):
+        with open(ENGINE_CONFIG) as config_file:
+            config.update(json.load(config_file))
+    return config
+
+
+def save_engine_config(
+    engine: str,
+    threads: int = 0,
+    quantized: bool = False,
+    report: Union[Dict[str, Any], None] = None,
+) -> None:
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}")
+    with open(ENGINE_CONFIG, "w") as config_file:
+        json.dump(
+            {
+                "engine": engine,
+                "threads": threads,
+                "quantized": quantized,
+                "report": report,
+            },
+            config_file,
+            indent=2,
+        )
+
+
+INFERENCE_ENGINE = load_engine_config()
+
+
+def engine_path(model_name: str, quantized: bool = False) -> str:
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return os.path.join(ENGINE_DIR, model_name + suffix)
+
+
+class OnnxModel:
+    def __init__(
+        self, path: str, engine: str = "onnxruntime", threads: int = 0
+    ) -> None:
+        import onnxruntime as ort
+
+        # one inference at a time on a fixed number of cores, 0 lets the
+        # runtime pick one thread per physical core
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        providers: List[Any] = ["CPUExecutionProvider"]
+        if engine == "openvino":
+            if "OpenVINOExecutionProvider" not in ort.get_available_providers():
+                raise RuntimeError(
+                    "OpenVINO engine needs the onnxruntime-openvino package"
+                )
+            openvino_options = {"device_type": "CPU"}
+            if threads:
+                openvino_options["num_of_threads"] = str(threads)
+            providers = [("OpenVINOExecutionProvider", openvino_options)] + providers
+
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=providers)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # same shape convention as keras, dynamic dimensions are None
+        self.input_shape = tuple(
+            dim if isinstance(dim, int) else None for dim in model_input.shape
+        )
+        self.output_shape = tuple(
+            dim if isinstance(dim, int) else None
+            for dim in self.session.get_outputs()[0].shape
+        )
+
+    def __call__(self, batch: np.ndarray, training: bool = False) -> np.ndarray:
+        inputs = {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)}
+        return self.session.run(None, inputs)[0]
+
+
+def load_engine_model(
+    model_name: str, config: Union[Dict[str, Any], None] = None
+) -> Union[OnnxModel, None]:
+    # None means the model stays on tensorflow, either by choice or because
+    # it was never exported
+    config = config if config else INFERENCE_ENGINE
+    if config["engine"] == "tensorflow":
+        return None
+    path = engine_path(model_name, config["quantized"])
+    if not os.path.exists(path):
+        return None
+    return OnnxModel(path, config["engine"], config["threads"])
+
+
+def letterbox(
+    img: np.ndarray, size: int = YOLO_SIZE
+) -> Tuple[np.ndarray, float, int, int]:
+    # same resize and grey padding as ultralytics, so exported weights see
+    # the inputs they were trained on
+    factor = min(size / img.shape[0], size / img.shape[1])
+    width = int(round(img.shape[1] * factor))
+    height = int(round(img.shape[0] * factor))
+    pad_x = (size - width) // 2
+    pad_y = (size - height) // 2
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[pad_y : pad_y + height, pad_x : pad_x + width] = cv2.resize(
+        img, (width, height), interpolation=cv2.INTER_LINEAR
+    )
+    batch = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)[None]
+    return batch.astype(np.float32) / 255, factor, pad_x, pad_y
+
+
+class YoloFaceDetector:
+    def __init__(
+        self,
+        model: OnnxModel,
+        confidence: float = 0.25,
+        iou_threshold: float = 0.45,
+    ) -> None:
+        self.model = model
+        self.confidence = confidence
+        self.iou_threshold = iou_threshold
+
+    def __call__(self, img: np.ndarray) -> DetectionBatch:
+        batch, factor, pad_x, pad_y = letterbox(img)
+        # one row per anchor: cx, cy, w, h, score, then x, y, visibility
+        # for each of the 5 keypoints
+        output = self.model(batch)[0].T
+        output = output[output[:, 4] > self.confidence]
+        if not len(output):
+            return DetectionBatch.empty()
+
+        centers = (output[:, :2] - (pad_x, pad_y)) / factor
+        sizes = output[:, 2:4] / factor
+        boxes = np.concatenate([centers - sizes / 2, sizes], axis=1)
+        keep = cv2.dnn.NMSBoxes(
+            boxes.tolist(), output[:, 4].tolist(), self.confidence, self.iou_threshold
+        )
+        keep = np.asarray(keep, dtype=np.int64).reshape(-1)
+
+        # deepface's yolov8 wrapper reads the first two keypoints as the eyes
+        keypoints = output[keep, 5:].reshape(-1, 5, 3)[:, :2, :2]
+        landmarks = (keypoints - (pad_x, pad_y)) / factor
+        return DetectionBatch(boxes[keep], output[keep, 4], landmarks)
+
+
+class CalibrationReader:
+    def __init__(self, input_name: str, batches: List[np.ndarray]) -> None:
+        # feeds onnxruntime's static quantizer one sample at a time
+        self.input_name = input_name
+        self.samples = [sample[None] for batch in batches for sample in batch]
+        self.index = 0
+
+    def get_next(self) -> Union[Dict[str, np.ndarray], None]:
+        if self.index >= len(self.samples):
+            return None
+        self.index += 1
+        return {self.input_name: self.samples[self.index - 1].astype(np.float32)}
+
+    def rewind(self) -> None:
+        self.index = 0
+
+
+def export_keras(model_name: str, opset: int = 13) -> str:
+    import tensorflow as tf
+    import tf2onnx
+
+    from helpers.models import load_keras_model
+
+    os.makedirs(ENGINE_DIR, exist_ok=True)
+    path = engine_path(model_name)
+    model = load_keras_model(model_name)
+    # a dynamic batch dimension, so batched calls keep working
+    signature = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32),)
+    tf2onnx.convert.from_keras(
+        model, input_signature=signature, opset=opset, output_path=path
+    )
+    return path
+
+
+def export_yolo(opset: int = 12) -> str:
+    from deepface.detectors import FaceDetector
+    from ultralytics import YOLO
+
+    # building deepface's detector downloads the face weights if needed
+    FaceDetector.build_model("yolov8")
+    home = os.getenv("DEEPFACE_HOME", os.path.expanduser("~"))
+    weights = os.path.join(home, ".deepface", "weights", YOLO_WEIGHTS)
+
+    os.makedirs(ENGINE_DIR, exist_ok=True)
+    exported = YOLO(weights).export(format="onnx", imgsz=YOLO_SIZE, opset=opset)
+    path = engine_path("yolov8")
+    shutil.move(exported, path)
+    return path
+
+
+def quantize(model_name: str, calibration: List[np.ndarray]) -> str:
+    from onnxruntime.quantization import (
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    source = engine_path(model_name)
+    prepared = source.replace(".onnx", ".prep.onnx")
+    path = engine_path(model_name, quantized=True)
+    quant_pre_process(source, prepared)
+
+    input_name = OnnxModel(source).input_name
+    # uint8 activations with int8 per channel weights is the fast path of
+    # the x86 kernels, the ranges come from the local calibration samples
+    quantize_static(
+        prepared,
+        path,
+        CalibrationReader(input_name, calibration),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    os.remove(prepared)
+    return path
+
+
+def _latency(function: Any, inputs: Any, repeats: int) -> float:
+    function(inputs)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(inputs)
+    return (time.perf_counter() - start) / repeats
+
+
+def compare_model(
+    reference: Any, candidate: OnnxModel, batch: np.ndarray, repeats: int = 10
+) -> Dict[str, float]:
+    expected = np.asarray(reference(batch, training=False))
+    actual = candidate(batch)
+    cosine = np.sum(expected * actual, axis=1) / np.maximum(
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1), 1e-10
+    )
+    reference_seconds = _latency(lambda x: reference(x, training=False), batch, repeats)
+    candidate_seconds = _latency(candidate, batch, repeats)
+    return {
+        "max_abs_error": float(np.abs(expected - actual).max()),
+        "min_cosine": float(cosine.min()),
+        "top1_agreement": float(
+            np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))
+        ),
+        "reference_ms": reference_seconds * 1000,
+        "engine_ms": candidate_seconds * 1000,
+        "speedup": reference_seconds / candidate_seconds,
+    }
+
+
+def compare_emotions(
+    candidate: OnnxModel, images: List[np.ndarray], detector_backend: str
+) -> Dict[str, float]:
+    from deepface import DeepFace
+
+    from helpers.models import input_size, preprocess_emotions
+    from helpers.quality import crop_box
+    from helpers.timeline import EMOTIONS
+
+    # the reference is deepface.analyze itself, so a preprocessing mismatch
+    # shows up here and not only differences between the two runtimes
+    expected, crops = [], []
+    for img in images:
+        faces = DeepFace.analyze(
+            img,
+            actions=["emotion"],
+            detector_backend=detector_backend,
+            enforce_detection=False,
+            align=False,
+            silent=True,
+        )
+        for face in faces:
+            region = face["region"]
+            if (region["w"], region["h"]) == img.shape[1::-1]:
+                continue
+            box = np.array([region[key] for key in ("x", "y", "w", "h")])
+            expected.append(face["dominant_emotion"])
+            crops.append(crop_box(img, box))
+    if not crops:
+        return {"deepface_top1_agreement": 0.0}
+
+    predictions = candidate(preprocess_emotions(crops, input_size(candidate)))
+    actual = [EMOTIONS[i] for i in predictions.argmax(axis=1)]
+    agreement = np.mean([a == b for a, b in zip(expected, actual)])
+    return {"deepface_top1_agreement": float(agreement)}
+
+
+def compare_detector(
+    detector: YoloFaceDetector, images: List[np.ndarray], repeats: int = 3
+) -> Dict[str, float]:
+    from deepface import DeepFace
+
+    from helpers.tracking import iou_matrix
+
+    def reference(img: np.ndarray) -> DetectionBatch:
+        detections = DetectionBatch.from_deepface(
+            DeepFace.extract_faces(
+                img, detector_backend="yolov8", enforce_detection=False
+            )
+        )
+        return detections[detections.confidences > 0]
+
+    # every reference face is matched to its best overlapping engine face
+    ious = []
+    count_matches = 0
+    for img in images:
+        expected, actual = reference(img), detector(img)
+        count_matches += len(expected) == len(actual)
+        if len(expected) and len(actual):
+            ious.extend(iou_matrix(expected.boxes, actual.boxes).max(axis=1))
+        else:
+            ious.extend([0.0] * len(expected))
+
+    reference_seconds = sum(_latency(reference, img, repeats) for img in images)
+    candidate_seconds = sum(_latency(detector, img, repeats) for img in images)
+    return {
+        "mean_iou": float(np.mean(ious)) if ious else 1.0,
+        "count_agreement": count_matches / len(images),
+        "reference_ms": reference_seconds / len(images) * 1000,
+        "engine_ms": candidate_seconds / len(images) * 1000,
+        "speedup": reference_seconds / candidate_seconds,
+    }
+
+
+def load_calibration(
+    image_dir: str, detector_backend: str
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    from helpers.enrollment import scan_images
+    from helpers.models import detect_faces
+    from helpers.quality import crop_box
+
+    images = [cv2.imread(path) for path in scan_images([image_dir])]
+    images = [img for img in images if img is not None]
+    crops = []
+    for img in images:
+        detections = detect_faces(img, detector_backend)
+        crops.extend(crop_box(img, box) for box in detections.boxes)
+    return images, crops
+
+
+def export_engines(
+    image_dir: str,
+    engine: str = "onnxruntime",
+    threads: int = 0,
+    quantized: bool = True,
+    detector_backend: str = "yolov8",
+    repeats: int = 10,
+) -> Dict[str, Dict[str, float]]:
+    from helpers.models import (
+        input_size,
+        load_keras_model,
+        preprocess_emotions,
+        preprocess_faces,
+    )
+
+    # the same local images calibrate the int8 ranges and check parity
+    images, crops = load_calibration(image_dir, detector_backend)
+    if not crops:
+        raise ValueError(f"No faces found in {image_dir} for calibration")
+    config = {"engine": engine, "threads": threads, "quantized": quantized}
+
+    reports = {}
+    for model_name, preprocess in (
+        ("Facenet512", preprocess_faces),
+        ("Emotion", preprocess_emotions),
+    ):
+        export_keras(model_name)
+        reference = load_keras_model(model_name)
+        batch = preprocess(crops, input_size(reference))
+        if quantized:
+            quantize(model_name, [batch])
+        candidate = load_engine_model(model_name, config)
+        reports[model_name] = compare_model(reference, candidate, batch, repeats)
+        if model_name == "Emotion":
+            reports[model_name].update(
+                compare_emotions(candidate, images, detector_backend)
+            )
+
+    export_yolo()
+    if quantized:
+        quantize("yolov8", [letterbox(img)[0] for img in images])
+    detector = YoloFaceDetector(load_engine_model("yolov8", config))
+    reports["yolov8"] = compare_detector(detector, images)
+    return reports
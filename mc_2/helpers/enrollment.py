@@ -0,0 +1,273 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.models import detect_faces, embed_faces
+from helpers.quality import crop_box
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def scan_images(roots: Iterable[str]) -> Iterator[str]:
+    # a lazy depth-first walk, so huge trees never sit in memory as a list
+    stack = list(roots)[::-1]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+
+def jpeg_size(path: str) -> Union[Tuple[int, int], None]:
+    # reads the frame header only, the pixels are never touched
+    with open(path, "rb") as image_file:
+        if image_file.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = image_file.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            code = marker[1]
+            if code == 0x01 or 0xD0 <= code <= 0xD7:
+                continue
+            length = int.from_bytes(image_file.read(2), "big")
+            if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                header = image_file.read(5)
+                height = int.from_bytes(header[1:3], "big")
+                width = int.from_bytes(header[3:5], "big")
+                return width, height
+            image_file.seek(length - 2, os.SEEK_CUR)
+
+
+def decode_image(path: str, max_side: int = 1600) -> Union[np.ndarray, None]:
+    flag = cv2.IMREAD_COLOR
+    if path.lower().endswith((".jpg", ".jpeg")):
+        size = jpeg_size(path)
+        if size is not None:
+            # let libjpeg decode straight at 1/2, 1/4 or 1/8 scale
+            for factor, reduced_flag in REDUCED_FLAGS:
+                if max(size) // factor >= max_side:
+                    flag = reduced_flag
+                    break
+
+    img = cv2.imread(path, flag)
+    if img is not None and max(img.shape[:2]) > max_side * 2:
+        factor = max_side / max(img.shape[:2])
+        img = cv2.resize(
+            img, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA
+        )
+    return img
+
+
+def _bounded_map(
+    function: Callable, items: Iterable, executor: ThreadPoolExecutor, window: int
+) -> Iterator[Tuple[Any, Any]]:
+    # keeps at most `window` decodes in flight and yields results in order
+    pending: deque = deque()
+    for item in items:
+        pending.append((item, executor.submit(function, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.embeddings_path = os.path.join(directory, "embeddings.f32")
+        self.metadata_path = os.path.join(directory, "metadata.jsonl")
+        self.checkpoint_path = os.path.join(directory, "checkpoint.json")
+
+        checkpoint = {"rows": 0, "dim": 0, "metadata_bytes": 0}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        self.rows = checkpoint["rows"]
+        self.dim = checkpoint["dim"]
+
+        # anything written after the last checkpoint belongs to a batch that
+        # was interrupted and is dropped, it is redone on resume
+        for path, size in (
+            (self.embeddings_path, self.rows * self.dim * 4),
+            (self.metadata_path, checkpoint["metadata_bytes"]),
+        ):
+            with open(path, "ab") as store_file:
+                store_file.truncate(size)
+
+        self.embeddings_file = open(self.embeddings_path, "ab")
+        self.metadata_file = open(self.metadata_path, "ab")
+
+    def processed_paths(self) -> set:
+        processed = set()
+        with open(self.metadata_path) as metadata_file:
+            for line in metadata_file:
+                processed.add(json.loads(line)["path"])
+        return processed
+
+    def append(self, records: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        if len(embeddings):
+            if not self.dim:
+                self.dim = embeddings.shape[1]
+            self.embeddings_file.write(embeddings.astype(np.float32).tobytes())
+        for record in records:
+            if record.get("row") is not None:
+                record["row"] += self.rows
+            self.metadata_file.write((json.dumps(record) + "\n").encode())
+        self.rows += len(embeddings)
+
+    def checkpoint(self) -> None:
+        for store_file in (self.embeddings_file, self.metadata_file):
+            store_file.flush()
+            os.fsync(store_file.fileno())
+        checkpoint = {
+            "rows": self.rows,
+            "dim": self.dim,
+            "metadata_bytes": self.metadata_file.tell(),
+        }
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def close(self) -> None:
+        self.embeddings_file.close()
+        self.metadata_file.close()
+
+    @staticmethod
+    def load(directory: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        with open(os.path.join(directory, "checkpoint.json")) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        with open(os.path.join(directory, "metadata.jsonl")) as metadata_file:
+            content = metadata_file.read(checkpoint["metadata_bytes"])
+            records = [json.loads(line) for line in content.splitlines()]
+        if not checkpoint["rows"]:
+            return records, np.empty((0, checkpoint["dim"]), np.float32)
+        embeddings = np.memmap(
+            os.path.join(directory, "embeddings.f32"),
+            dtype=np.float32,
+            mode="r",
+            shape=(checkpoint["rows"], checkpoint["dim"]),
+        )
+        return records, embeddings
+
+
+def label_from_directory(path: str) -> str:
+    return os.path.basename(os.path.dirname(path))
+
+
+class EnrollmentPipeline:
+    def __init__(
+        self,
+        store_dir: str,
+        model_name: str = "Facenet512",
+        detector_backend: str = DETECTOR_BACKEND,
+        batch_size: int = 64,
+        decode_workers: int = 8,
+        max_side: int = 1600,
+        label_fn: Callable[[str], str] = label_from_directory,
+    ) -> None:
+        self.store = EmbeddingStore(store_dir)
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.max_side = max_side
+        self.label_fn = label_fn
+
+    def _decode(self, path: str) -> Union[np.ndarray, None]:
+        try:
+            return decode_image(path, self.max_side)
+        except (OSError, ValueError, cv2.error):
+            return None
+
+    def _detect(self, img: np.ndarray) -> Union[np.ndarray, None]:
+        detections = detect_faces(img, self.detector_backend)
+        largest = detections.largest()
+        return None if largest is None else detections.boxes[largest]
+
+    def _flush(self, records: List[Dict[str, Any]], crops: List[np.ndarray]) -> None:
+        # one batched forward pass per flush, then one checkpoint
+        embeddings = embed_faces(crops, self.model_name, batch_size=self.batch_size)
+        self.store.append(records, embeddings)
+        self.store.checkpoint()
+
+    def run(self, roots: Iterable[str]) -> Dict[str, float]:
+        processed = self.store.processed_paths()
+        pending = (path for path in scan_images(roots) if path not in processed)
+        start = time.perf_counter()
+        stats = {"resumed": len(processed), "images": 0, "faces": 0, "failed": 0}
+
+        records: List[Dict[str, Any]] = []
+        crops: List[np.ndarray] = []
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as executor:
+            decoded = _bounded_map(
+                self._decode,
+                pending,
+                executor,
+                window=self.decode_workers * 4,
+            )
+            for path, img in decoded:
+                stats["images"] += 1
+                record: Dict[str, Any] = {"path": path, "label": self.label_fn(path)}
+                box = None
+                if img is None:
+                    record["error"] = "unreadable"
+                else:
+                    # one bad image must not stop the run, it goes into the
+                    # manifest as failed so a resume skips it as well
+                    try:
+                        box = self._detect(img)
+                    except Exception as error:
+                        record["error"] = f"{type(error).__name__}: {error}"
+                crop = None if box is None else crop_box(img, box)
+                if crop is not None and not crop.size:
+                    record["error"] = "empty face crop"
+                if "error" in record:
+                    stats["failed"] += 1
+                elif crop is not None:
+                    record["row"] = len(crops)
+                    record["box"] = [int(value) for value in box]
+                    crops.append(crop)
+                    stats["faces"] += 1
+                records.append(record)
+
+                # images without faces still need checkpointing now and then
+                if (
+                    len(crops) >= self.batch_size
+                    or len(records) >= self.batch_size * 8
+                ):
+                    self._flush(records, crops)
+                    records, crops = [], []
+
+            if records:
+                self._flush(records, crops)
+
+        self.store.close()
+        stats["elapsed"] = time.perf_counter() - start
+        return stats
@@ -0,0 +1,249 @@
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.enrollment import (
+    EmbeddingStore,
+    decode_image,
+    label_from_directory,
+    scan_images,
+)
+from helpers.models import detect_faces, embed_faces
+from helpers.quality import crop_box
+
+METRICS = ("cosine", "euclidean_l2")
+
+Face = Dict[str, Any]
+
+
+def _load_index(index_path: str) -> Dict[str, Face]:
+    faces = {}
+    if not os.path.exists(index_path):
+        return faces
+    with open(index_path, "rb+") as index_file:
+        content = index_file.read()
+        # a line cut short by an interrupted run is dropped, so the next
+        # append starts on a line of its own
+        complete = content.rfind(b"\n") + 1
+        index_file.truncate(complete)
+    for line in content[:complete].splitlines():
+        face = json.loads(line)
+        faces[face["path"]] = face
+    return faces
+
+
+def _detect(img: Union[np.ndarray, None], detector_backend: str) -> Face:
+    if img is None:
+        return {"box": None, "error": "unreadable"}
+    try:
+        detections = detect_faces(img, detector_backend)
+    except Exception as error:
+        return {"box": None, "error": f"{type(error).__name__}: {error}"}
+    largest = detections.largest()
+    if largest is None:
+        return {"box": None}
+    return {"box": [int(value) for value in detections.boxes[largest]]}
+
+
+def _embed_chunk(
+    chunk: List[Tuple[Face, np.ndarray]],
+    stores: Dict[str, EmbeddingStore],
+    processed: Dict[str, set],
+    stats: Dict[str, Dict[str, float]],
+    batch_size: int,
+) -> None:
+    for model_name, store in stores.items():
+        todo = [
+            (face, crop)
+            for face, crop in chunk
+            if face["path"] not in processed[model_name]
+        ]
+        if not todo:
+            continue
+        crops = [crop for _, crop in todo]
+        if not stats[model_name]["faces"]:
+            # the first call builds the model, keep it out of the timing
+            embed_faces(crops[:1], model_name, batch_size=batch_size)
+        # only the embedding model is timed, decode and detection are shared
+        start = time.perf_counter()
+        embeddings = embed_faces(crops, model_name, batch_size=batch_size)
+        stats[model_name]["embed_seconds"] += time.perf_counter() - start
+        stats[model_name]["faces"] += len(todo)
+
+        records = [
+            {"path": face["path"], "label": face["label"], "box": face["box"], "row": i}
+            for i, (face, _) in enumerate(todo)
+        ]
+        store.append(records, embeddings)
+        store.checkpoint()
+        processed[model_name].update(face["path"] for face, _ in todo)
+
+
+def embed_dataset(
+    image_dir: str,
+    model_names: Sequence[str],
+    cache_dir: str,
+    detector_backend: str = DETECTOR_BACKEND,
+    workers: int = 8,
+    chunk_size: int = 256,
+    batch_size: int = 32,
+    max_side: int = 1600,
+) -> Dict[str, Dict[str, float]]:
+    # every image is decoded, detected and cropped once for all models, the
+    # boxes go to faces.jsonl and each model keeps its own embedding store,
+    # so later runs only touch new images or models that were added
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "faces.jsonl")
+    faces = _load_index(index_path)
+    stores = {
+        model_name: EmbeddingStore(os.path.join(cache_dir, model_name))
+        for model_name in model_names
+    }
+    processed = {
+        model_name: store.processed_paths() for model_name, store in stores.items()
+    }
+    stats = {
+        model_name: {"faces": 0, "embed_seconds": 0.0} for model_name in model_names
+    }
+
+    def pending(path: str) -> bool:
+        face = faces.get(path)
+        if face is None:
+            return True
+        return face["box"] is not None and any(
+            path not in paths for paths in processed.values()
+        )
+
+    paths = (path for path in scan_images([image_dir]) if pending(path))
+    try:
+        with open(index_path, "a") as index_file, ThreadPoolExecutor(
+            max_workers=workers
+        ) as executor:
+            while chunk_paths := list(itertools.islice(paths, chunk_size)):
+                images = executor.map(
+                    lambda path: decode_image(path, max_side), chunk_paths
+                )
+                chunk = []
+                for path, img in zip(chunk_paths, images):
+                    face = faces.get(path)
+                    if face is None:
+                        face = {
+                            "path": path,
+                            "label": label_from_directory(path),
+                            **_detect(img, detector_backend),
+                        }
+                        faces[path] = face
+                        index_file.write(json.dumps(face) + "\n")
+                    if face["box"] is not None and img is not None:
+                        crop = crop_box(img, np.array(face["box"]))
+                        if crop.size:
+                            chunk.append((face, crop))
+                _embed_chunk(chunk, stores, processed, stats, batch_size)
+                index_file.flush()
+    finally:
+        for store in stores.values():
+            store.close()
+    return stats
+
+
+def load_embeddings(model_name: str, cache_dir: str) -> Tuple[np.ndarray, np.ndarray]:
+    records, embeddings = EmbeddingStore.load(os.path.join(cache_dir, model_name))
+    labels = np.empty(len(embeddings), dtype=object)
+    for record in records:
+        if record.get("row") is not None:
+            labels[record["row"]] = record["label"]
+    return np.asarray(embeddings), labels
+
+
+def distance_matrix(embeddings: np.ndarray, metric: str) -> np.ndarray:
+    # rows are l2 normalized, so both metrics come from one matrix product
+    cosine = np.clip(1 - embeddings @ embeddings.T, 0, 2)
+    if metric == "cosine":
+        return cosine
+    if metric == "euclidean_l2":
+        return np.sqrt(2 * cosine)
+    raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}")
+
+
+def pair_distances(
+    embeddings: np.ndarray, labels: np.ndarray, metric: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    # every unordered pair once, genuine when both faces share a label
+    rows, cols = np.triu_indices(len(labels), k=1)
+    distances = distance_matrix(embeddings, metric)[rows, cols]
+    return distances, labels[rows] == labels[cols]
+
+
+def roc_curve(distances: np.ndarray, genuine: np.ndarray) -> Dict[str, np.ndarray]:
+    # a pair is accepted when its distance is at or below the threshold, one
+    # point per distinct distance
+    order = np.argsort(distances, kind="stable")
+    distances = distances[order]
+    genuine = genuine[order]
+    last = np.r_[np.diff(distances) > 0, True]
+    true_accepts = np.cumsum(genuine)[last]
+    false_accepts = np.cumsum(~genuine)[last]
+    return {
+        "thresholds": distances[last],
+        "tpr": true_accepts / max(int(genuine.sum()), 1),
+        "fpr": false_accepts / max(int((~genuine).sum()), 1),
+    }
+
+
+def summarize_curve(curve: Dict[str, np.ndarray]) -> Dict[str, float]:
+    tpr, fpr, thresholds = curve["tpr"], curve["fpr"], curve["thresholds"]
+    eer_index = int(np.argmin(np.abs((1 - tpr) - fpr)))
+    balanced_accuracy = (tpr + 1 - fpr) / 2
+    best_index = int(balanced_accuracy.argmax())
+    x = np.r_[0.0, fpr]
+    y = np.r_[0.0, tpr]
+    return {
+        "eer": float(((1 - tpr[eer_index]) + fpr[eer_index]) / 2),
+        "eer_threshold": float(thresholds[eer_index]),
+        "best_threshold": float(thresholds[best_index]),
+        "best_balanced_accuracy": float(balanced_accuracy[best_index]),
+        "auc": float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2)),
+    }
+
+
+def evaluate_models(
+    image_dir: str,
+    model_names: Sequence[str],
+    metrics: Sequence[str] = METRICS,
+    cache_dir: str = "evaluation",
+    detector_backend: str = DETECTOR_BACKEND,
+    workers: int = 8,
+) -> List[Dict[str, Any]]:
+    stats = embed_dataset(image_dir, model_names, cache_dir, detector_backend, workers)
+    reports = []
+    for model_name in model_names:
+        embeddings, labels = load_embeddings(model_name, cache_dir)
+        # embedding throughput, faces already in the store are not timed
+        faces = stats[model_name]["faces"]
+        seconds = stats[model_name]["embed_seconds"]
+        throughput = faces / seconds if faces and seconds else None
+
+        for metric in metrics:
+            distances, genuine = pair_distances(embeddings, labels, metric)
+            curve = roc_curve(distances, genuine)
+            np.savez_compressed(
+                os.path.join(cache_dir, f"roc_{model_name}_{metric}.npz"), **curve
+            )
+            reports.append(
+                {
+                    "model": model_name,
+                    "metric": metric,
+                    "faces": len(labels),
+                    "pairs": len(distances),
+                    "genuine_pairs": int(genuine.sum()),
+                    "faces_per_second": throughput,
+                    **summarize_curve(curve),
+                }
+            )
+    return reports
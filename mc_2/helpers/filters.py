@@ -0,0 +1,317 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List, Tuple, Union
+
+
+class PointFilter(ABC):
+    # seconds the returned position is projected past the capture time
+    lead = 0.0
+
+    def reset(self) -> None:
+        pass
+
+    @abstractmethod
+    def __call__(
+        self, x: float, y: float, timestamp: float, latency: float
+    ) -> Tuple[float, float]:
+        pass
+
+
+class EasingFilter(PointFilter):
+    def __init__(self, easing: float = 0.5) -> None:
+        self.easing = easing
+        self.x = None
+        self.y = None
+
+    def reset(self) -> None:
+        self.x = None
+        self.y = None
+
+    def __call__(
+        self, x: float, y: float, timestamp: float, latency: float
+    ) -> Tuple[float, float]:
+        if self.x is None or self.y is None:
+            self.x, self.y = x, y
+        else:
+            self.x += (x - self.x) * self.easing
+            self.y += (y - self.y) * self.easing
+        return self.x, self.y
+
+
+class _LowPass:
+    def __init__(self) -> None:
+        self.value = None
+
+    def __call__(self, value: float, alpha: float) -> float:
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += alpha * (value - self.value)
+        return self.value
+
+
+class OneEuroFilter(PointFilter):
+    def __init__(
+        self,
+        min_cutoff: float = 1.0,
+        beta: float = 5.0,
+        d_cutoff: float = 1.0,
+    ) -> None:
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self) -> None:
+        self.last_timestamp = None
+        self.last_raw = None
+        self.position = (_LowPass(), _LowPass())
+        self.derivative = (_LowPass(), _LowPass())
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(
+        self, x: float, y: float, timestamp: float, latency: float
+    ) -> Tuple[float, float]:
+        if self.last_timestamp is None or self.last_raw is None:
+            self.last_timestamp = timestamp
+            self.last_raw = (x, y)
+            return self.position[0](x, 1.0), self.position[1](y, 1.0)
+
+        dt = max(timestamp - self.last_timestamp, 1e-6)
+        self.last_timestamp = timestamp
+
+        filtered = []
+        for axis, value in enumerate((x, y)):
+            # the cutoff rises with speed: heavy smoothing at rest, little lag
+            # while the hand is moving fast
+            speed = self.derivative[axis](
+                (value - self.last_raw[axis]) / dt, self._alpha(self.d_cutoff, dt)
+            )
+            cutoff = self.min_cutoff + self.beta * abs(speed)
+            filtered.append(self.position[axis](value, self._alpha(cutoff, dt)))
+        self.last_raw = (x, y)
+
+        return filtered[0], filtered[1]
+
+
+class KalmanPredictor(PointFilter):
+    def __init__(
+        self,
+        process_noise: float = 50.0,
+        measurement_noise: float = 1e-4,
+        max_lead: float = 0.15,
+    ) -> None:
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_lead = max_lead
+        self.reset()
+
+    def reset(self) -> None:
+        self.last_timestamp = None
+        self.lead = 0.0
+        # per axis: position, velocity and the 2x2 covariance [p00, p01, p11]
+        self.state = [[0.0, 0.0], [0.0, 0.0]]
+        self.covariance = [[1.0, 0.0, 1.0], [1.0, 0.0, 1.0]]
+
+    def _step(self, axis: int, measurement: float, dt: float) -> None:
+        position, velocity = self.state[axis]
+        p00, p01, p11 = self.covariance[axis]
+
+        # predict with a constant-velocity model driven by white acceleration
+        q = self.process_noise
+        position += velocity * dt
+        p00 += dt * (2 * p01 + dt * p11) + q * dt**4 / 4
+        p01 += dt * p11 + q * dt**3 / 2
+        p11 += q * dt**2
+
+        # correct with the measured position
+        s = p00 + self.measurement_noise
+        k0 = p00 / s
+        k1 = p01 / s
+        residual = measurement - position
+        position += k0 * residual
+        velocity += k1 * residual
+        p00, p01, p11 = (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01
+
+        self.state[axis] = [position, velocity]
+        self.covariance[axis] = [p00, p01, p11]
+
+    def __call__(
+        self, x: float, y: float, timestamp: float, latency: float
+    ) -> Tuple[float, float]:
+        if self.last_timestamp is None:
+            self.last_timestamp = timestamp
+            self.state = [[x, 0.0], [y, 0.0]]
+            return x, y
+
+        dt = max(timestamp - self.last_timestamp, 1e-6)
+        self.last_timestamp = timestamp
+        self._step(0, x, dt)
+        self._step(1, y, dt)
+
+        # project forward by the pipeline latency so the cursor shows where the
+        # hand is now rather than where it was when the frame was captured
+        self.lead = min(max(latency, 0.0), self.max_lead)
+        return (
+            self.state[0][0] + self.state[0][1] * self.lead,
+            self.state[1][0] + self.state[1][1] * self.lead,
+        )
+
+
+class CursorFilter:
+    def __init__(
+        self,
+        stages: Union[List[PointFilter], None] = None,
+        extra_latency: float = 0.0,
+        reset_after: float = 0.5,
+        window: int = 120,
+    ) -> None:
+        if stages is None:
+            stages = [OneEuroFilter(), KalmanPredictor()]
+        self.stages = stages
+        self.extra_latency = extra_latency
+        self.reset_after = reset_after
+        self.last_timestamp = None
+        self.lead = 0.0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.processing_times: Deque[float] = deque(maxlen=window)
+        self.raw_points: Deque[Tuple[float, float]] = deque(maxlen=window)
+        self.filtered_points: Deque[Tuple[float, float]] = deque(maxlen=window)
+
+    def reset(self) -> None:
+        for stage in self.stages:
+            stage.reset()
+        self.raw_points.clear()
+        self.filtered_points.clear()
+
+    def __call__(
+        self, x: float, y: float, capture_time: float
+    ) -> Tuple[float, float]:
+        start = time.perf_counter()
+        if (
+            self.last_timestamp is not None
+            and capture_time - self.last_timestamp > self.reset_after
+        ):
+            self.reset()
+        self.last_timestamp = capture_time
+
+        latency = start - capture_time + self.extra_latency
+        self.latencies.append(latency)
+        self.raw_points.append((x, y))
+
+        for stage in self.stages:
+            x, y = stage(x, y, capture_time, latency)
+        # the returned position belongs to capture_time + lead, not capture_time
+        self.lead = sum(stage.lead for stage in self.stages)
+
+        self.filtered_points.append((x, y))
+        self.processing_times.append(time.perf_counter() - start)
+        return x, y
+
+    @staticmethod
+    def _jitter(points: Deque[Tuple[float, float]]) -> float:
+        # rms of the second difference: constant-velocity motion scores zero,
+        # frame-to-frame shaking does not
+        if len(points) < 3:
+            return 0.0
+        points_list = list(points)
+        total = 0.0
+        for (x0, y0), (x1, y1), (x2, y2) in zip(
+            points_list, points_list[1:], points_list[2:]
+        ):
+            total += (x2 - 2 * x1 + x0) ** 2 + (y2 - 2 * y1 + y0) ** 2
+        return math.sqrt(total / (len(points_list) - 2))
+
+    def stats(self) -> Dict[str, float]:
+        count = len(self.latencies)
+        return {
+            "latency_ms": sum(self.latencies) / count * 1000 if count else 0.0,
+            "filter_ms": (
+                sum(self.processing_times) / count * 1000 if count else 0.0
+            ),
+            "raw_jitter": self._jitter(self.raw_points),
+            "filtered_jitter": self._jitter(self.filtered_points),
+        }
+
+
+class PointInterpolator:
+    def __init__(
+        self,
+        delay: Union[float, None] = None,
+        max_delay: float = 0.1,
+        reset_after: float = 0.5,
+        smoothing: float = 0.1,
+        window: int = 8,
+    ) -> None:
+        # positions are drawn a little in the past, between the two samples
+        # around that moment, so the cursor moves at the render rate instead
+        # of jumping once per tracked frame. delay None follows the measured
+        # lag and interval of the samples, a float fixes it in seconds
+        self.delay = delay
+        self.max_delay = max_delay
+        self.reset_after = reset_after
+        self.smoothing = smoothing
+        self.samples: Deque[Tuple[float, float, float]] = deque(maxlen=window)
+        self.interval: Union[float, None] = None
+        self.lag: Union[float, None] = None
+
+    def reset(self) -> None:
+        self.samples.clear()
+        self.interval = None
+
+    def _average(self, average: Union[float, None], value: float) -> float:
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+    def add(
+        self, x: float, y: float, timestamp: float, now: Union[float, None] = None
+    ) -> None:
+        # timestamp is the moment the position refers to, now when it arrived
+        if now is None:
+            now = time.perf_counter()
+        if self.samples:
+            interval = timestamp - self.samples[-1][0]
+            if interval <= 0:
+                return
+            if interval > self.reset_after:
+                self.reset()
+            else:
+                self.interval = self._average(self.interval, interval)
+        self.lag = self._average(self.lag, max(now - timestamp, 0.0))
+        self.samples.append((timestamp, x, y))
+
+    def render_time(self, now: Union[float, None] = None) -> float:
+        if now is None:
+            now = time.perf_counter()
+        delay = self.delay
+        if delay is None:
+            # a sample arrives lag after its capture and the next one an
+            # interval later, drawing that far back keeps a pair to blend
+            delay = min((self.lag or 0.0) + (self.interval or 0.0), self.max_delay)
+        return now - delay
+
+    def __call__(
+        self, now: Union[float, None] = None
+    ) -> Union[Tuple[float, float], None]:
+        if not self.samples:
+            return None
+        moment = self.render_time(now)
+        # outside the buffered samples the nearest one is held, never
+        # extrapolated, so a lost hand does not fling the cursor away
+        if moment >= self.samples[-1][0]:
+            return self.samples[-1][1], self.samples[-1][2]
+        if moment <= self.samples[0][0]:
+            return self.samples[0][1], self.samples[0][2]
+        samples = list(self.samples)
+        for (t0, x0, y0), (t1, x1, y1) in zip(samples, samples[1:]):
+            if moment <= t1:
+                alpha = (moment - t0) / (t1 - t0)
+                return x0 + (x1 - x0) * alpha, y0 + (y1 - y0) * alpha
+        return self.samples[-1][1], self.samples[-1][2]
@@ -0,0 +1,138 @@
+from typing import Dict, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.detections import DetectionBatch
+from helpers.models import detect_faces, embed_faces
+from helpers.quality import align_crop, crop_box
+from helpers.tracking import IouTracker
+
+# deepface's cosine distance threshold for Facenet512
+FACENET512_THRESHOLD = 0.30
+
+
+class Gallery:
+    def __init__(self, names: List[str], embeddings: np.ndarray) -> None:
+        self.names = names
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    @classmethod
+    def from_images(
+        cls,
+        images: Dict[str, List[str]],
+        model_name: str = "Facenet512",
+        detector_backend: str = DETECTOR_BACKEND,
+        align: bool = False,
+    ) -> "Gallery":
+        # gallery faces have to be cut like the probes they are matched with,
+        # aligned for AnalysisPipeline, plain boxes for IdentityTracker
+        names = []
+        crops = []
+        for name, paths in images.items():
+            for path in paths:
+                img = cv2.imread(path)
+                detections = detect_faces(img, detector_backend)
+                largest = detections.largest()
+                if largest is None:
+                    continue
+                names.append(name)
+                box = detections.boxes[largest]
+                if align:
+                    landmarks = detections.landmarks
+                    eyes = None if landmarks is None else landmarks[largest]
+                    crops.append(align_crop(img, box, eyes))
+                else:
+                    crops.append(crop_box(img, box))
+        return cls(names, embed_faces(crops, model_name))
+
+    @classmethod
+    def from_store(cls, directory: str) -> "Gallery":
+        from helpers.enrollment import EmbeddingStore
+
+        records, embeddings = EmbeddingStore.load(directory)
+        names = [None] * len(embeddings)
+        for record in records:
+            if record.get("row") is not None:
+                names[record["row"]] = record["label"]
+        return cls(names, np.asarray(embeddings))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def match(
+        self, embeddings: np.ndarray, threshold: float = FACENET512_THRESHOLD
+    ) -> Tuple[List[Union[str, None]], np.ndarray]:
+        if not len(self) or not len(embeddings):
+            return [None] * len(embeddings), np.ones(len(embeddings))
+        # both sides are l2 normalized, so cosine distance is one matrix product
+        distances = 1 - embeddings @ self.embeddings.T
+        best = distances.argmin(axis=1)
+        best_distances = distances[np.arange(len(embeddings)), best]
+        names = [
+            self.names[index] if distance <= threshold else None
+            for index, distance in zip(best, best_distances)
+        ]
+        return names, best_distances
+
+
+class IdentityTracker:
+    def __init__(
+        self,
+        gallery: Gallery,
+        tracker: Union[IouTracker, None] = None,
+        model_name: str = "Facenet512",
+        threshold: float = FACENET512_THRESHOLD,
+        confirm_every: int = 60,
+    ) -> None:
+        self.gallery = gallery
+        self.tracker = tracker if tracker else IouTracker()
+        self.model_name = model_name
+        self.threshold = threshold
+        self.confirm_every = confirm_every
+
+        # track id -> [name, distance, frames since the last embedding]
+        self.identities: Dict[int, list] = {}
+        self.frames = 0
+        self.faces = 0
+        self.embeddings = 0
+
+    def update(
+        self, frame: np.ndarray, detections: DetectionBatch
+    ) -> Tuple[np.ndarray, List[Union[str, None]]]:
+        track_ids = self.tracker.update(detections)
+        self.frames += 1
+        self.faces += len(track_ids)
+
+        # only new tracks and tracks due for confirmation reach the model
+        pending = []
+        for i, track_id in enumerate(track_ids.tolist()):
+            identity = self.identities.get(track_id)
+            if identity is None or identity[2] >= self.confirm_every:
+                pending.append(i)
+            else:
+                identity[2] += 1
+
+        if pending:
+            crops = [crop_box(frame, detections.boxes[i]) for i in pending]
+            embeddings = embed_faces(crops, self.model_name)
+            self.embeddings += len(crops)
+            names, distances = self.gallery.match(embeddings, self.threshold)
+            for i, name, distance in zip(pending, names, distances):
+                self.identities[int(track_ids[i])] = [name, float(distance), 0]
+
+        alive = set(self.tracker.track_ids.tolist())
+        for track_id in list(self.identities):
+            if track_id not in alive:
+                del self.identities[track_id]
+
+        return track_ids, [self.identities[int(i)][0] for i in track_ids]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "frames": self.frames,
+            "faces": self.faces,
+            "embeddings": self.embeddings,
+            "embeddings_per_face": self.embeddings / self.faces if self.faces else 0.0,
+        }
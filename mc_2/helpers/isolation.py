@@ -0,0 +1,246 @@
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+# a worker is a generator function taking a stop event and yielding
+# (annotated frame, compact result) pairs. the vision process also passes
+# claim_frame, a callable returning the shared slot the next frame should be
+# rendered into, so the frame never has to be copied
+Worker = Callable[..., Iterator[Tuple[np.ndarray, Any]]]
+
+
+class SharedFrameRing:
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        slots: int = 3,
+        name: Union[str, None] = None,
+    ) -> None:
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.owner = name is None
+
+        # header: latest published sequence number, then the sequence per slot
+        header_bytes = 8 * (1 + slots)
+        frame_bytes = int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner, size=header_bytes + frame_bytes * slots
+        )
+        self.header = np.ndarray((1 + slots,), np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray(
+            (slots,) + self.shape, np.uint8, buffer=self.shm.buf, offset=header_bytes
+        )
+        if self.owner:
+            self.header[:] = -1
+        self.claimed: Union[int, None] = None
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def claim(self) -> np.ndarray:
+        # the writer renders the next frame straight into the returned slot,
+        # it is never the latest one, and readers skip it while it is -1
+        if self.claimed is None:
+            self.claimed = int(self.header[0]) + 1
+            self.header[1 + self.claimed % self.slots] = -1
+        return self.frames[self.claimed % self.slots]
+
+    def publish(self, frame: np.ndarray) -> int:
+        # a frame rendered into the claimed slot is published as it is, any
+        # other frame is copied into a slot first
+        slot_frame = self.claim()
+        if not np.may_share_memory(frame, slot_frame):
+            np.copyto(slot_frame, frame)
+        sequence = self.claimed
+        self.claimed = None
+        self.header[1 + sequence % self.slots] = sequence
+        self.header[0] = sequence
+        return sequence
+
+    def latest(self) -> Tuple[int, Union[np.ndarray, None]]:
+        # the view is the slot itself, check intact() after using it
+        sequence = int(self.header[0])
+        if sequence < 0:
+            return sequence, None
+        slot = sequence % self.slots
+        if self.header[1 + slot] != sequence:
+            return sequence, None
+        return sequence, self.frames[slot]
+
+    def intact(self, sequence: int) -> bool:
+        # false once the writer has claimed the slot again, anything read
+        # from the view since latest() may then be torn
+        return int(self.header[1 + sequence % self.slots]) == sequence
+
+    def close(self) -> None:
+        # numpy views must be released before the mapping can be closed
+        del self.header
+        del self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _vision_main(
+    worker: Worker,
+    ring_name: str,
+    frame_shape: Tuple[int, ...],
+    slots: int,
+    conn,
+    stop_event,
+    cpu: Union[int, None],
+) -> None:
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+    ring = SharedFrameRing(frame_shape, slots, name=ring_name)
+    try:
+        for frame, result in worker(stop_event, claim_frame=ring.claim):
+            sequence = ring.publish(frame)
+            conn.send((sequence, result))
+            if stop_event.is_set():
+                break
+    finally:
+        conn.close()
+        ring.close()
+
+
+class VisionProcess:
+    def __init__(
+        self,
+        worker: Worker,
+        frame_shape: Tuple[int, ...],
+        slots: int = 3,
+        cpu: Union[int, None] = None,
+    ) -> None:
+        self.frame_shape = tuple(frame_shape)
+        self.cpu = cpu
+        self.ring = SharedFrameRing(self.frame_shape, slots)
+        self.sequence = -1
+
+        # spawn so the child starts with its own interpreter and ml runtime
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe(duplex=False)
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=_vision_main,
+            args=(
+                worker,
+                self.ring.name,
+                self.frame_shape,
+                slots,
+                child_conn,
+                self.stop_event,
+                cpu,
+            ),
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self.process.start()
+        # leave the inference core to the child
+        if self.cpu is not None and hasattr(os, "sched_setaffinity"):
+            cores = os.sched_getaffinity(0) - {self.cpu}
+            if cores:
+                os.sched_setaffinity(0, cores)
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def poll(self) -> List[Any]:
+        # never blocks: returns every result published since the last call
+        results = []
+        try:
+            while self.conn.poll():
+                self.sequence, result = self.conn.recv()
+                results.append(result)
+        except EOFError:
+            pass
+        return results
+
+    def frame(self) -> Union[np.ndarray, None]:
+        # a view of the shared slot, read_frame() tells when it was torn
+        _, frame = self.ring.latest()
+        return frame
+
+    def read_frame(
+        self, consumer: Callable[[np.ndarray], Any], retries: int = 2
+    ) -> bool:
+        # the consumer reads the shared slot without a copy, when the child
+        # reclaimed the slot meanwhile it runs again on the newest frame
+        for _ in range(retries + 1):
+            sequence, frame = self.ring.latest()
+            if frame is None:
+                return False
+            consumer(frame)
+            if self.ring.intact(sequence):
+                return True
+        return False
+
+    def close(self) -> None:
+        self.stop_event.set()
+        # drain so the child is never blocked on a full pipe while stopping
+        self.poll()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        self.ring.close()
+
+
+class VisionThread:
+    def __init__(self, worker: Worker) -> None:
+        # the same interface as VisionProcess in a thread of this process,
+        # the caller keeps its own pace while the worker waits on the camera
+        # and on inference, but both share the gil
+        self.worker = worker
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.results: List[Any] = []
+        self.latest: Union[np.ndarray, None] = None
+        self.sequence = -1
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        for frame, result in self.worker(self.stop_event):
+            # the worker reuses its frame buffer for the next frame
+            frame = frame.copy()
+            with self.lock:
+                self.latest = frame
+                self.results.append(result)
+                self.sequence += 1
+            if self.stop_event.is_set():
+                break
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def is_alive(self) -> bool:
+        return self.thread.is_alive()
+
+    def poll(self) -> List[Any]:
+        with self.lock:
+            results, self.results = self.results, []
+        return results
+
+    def frame(self) -> Union[np.ndarray, None]:
+        return self.latest
+
+    def read_frame(
+        self, consumer: Callable[[np.ndarray], Any], retries: int = 2
+    ) -> bool:
+        # frames are copies here, they are never overwritten while read
+        frame = self.latest
+        if frame is None:
+            return False
+        consumer(frame)
+        return True
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.thread.join(timeout=5)
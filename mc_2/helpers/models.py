@@ -0,0 +1,134 @@
+import functools
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from helpers.detections import DetectionBatch
+
+# deepface extracts every face at this size before its attribute models
+FACE_SIZE = (224, 224)
+
+
+@functools.lru_cache(maxsize=None)
+def load_keras_model(model_name: str):
+    from deepface import DeepFace
+
+    model = DeepFace.build_model(model_name)
+    # newer deepface releases wrap the keras model in a client object
+    return getattr(model, "model", model)
+
+
+@functools.lru_cache(maxsize=None)
+def load_model(model_name: str):
+    from helpers.engine import load_engine_model
+
+    # an exported onnx model replaces the keras one when an engine is set
+    model = load_engine_model(model_name)
+    return model if model is not None else load_keras_model(model_name)
+
+
+@functools.lru_cache(maxsize=None)
+def load_detector(detector_backend: str):
+    from helpers.engine import YoloFaceDetector, load_engine_model
+
+    if detector_backend != "yolov8":
+        return None
+    model = load_engine_model(detector_backend)
+    return YoloFaceDetector(model) if model is not None else None
+
+
+def thread_safe_detector(detector_backend: str) -> bool:
+    # an onnxruntime session can run from several threads at once, deepface
+    # keeps one cached model per backend, e.g. ultralytics yolo, that cannot
+    return load_detector(detector_backend) is not None
+
+
+def detect_faces(img: np.ndarray, detector_backend: str) -> DetectionBatch:
+    detector = load_detector(detector_backend)
+    if detector is not None:
+        return detector(img)
+
+    from deepface import DeepFace
+
+    detections = DetectionBatch.from_deepface(
+        DeepFace.extract_faces(
+            img, detector_backend=detector_backend, enforce_detection=False
+        )
+    )
+    # without a face deepface returns the whole image with zero confidence
+    return detections[detections.confidences > 0]
+
+
+def input_size(model) -> Tuple[int, int]:
+    height, width = model.input_shape[1:3]
+    return int(height), int(width)
+
+
+def resize_with_padding(face: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    # same steps as deepface: keep the aspect ratio, pad to the target size
+    # with black and scale pixels to [0, 1]
+    target_height, target_width = size
+    factor = min(target_height / face.shape[0], target_width / face.shape[1])
+    resized = cv2.resize(
+        face,
+        (max(1, int(face.shape[1] * factor)), max(1, int(face.shape[0] * factor))),
+    )
+    pad_height = target_height - resized.shape[0]
+    pad_width = target_width - resized.shape[1]
+    padding = [
+        (pad_height // 2, pad_height - pad_height // 2),
+        (pad_width // 2, pad_width - pad_width // 2),
+    ] + [(0, 0)] * (resized.ndim - 2)
+    padded = np.pad(resized, padding, "constant")
+    return padded.astype(np.float32) / 255
+
+
+def preprocess_faces(crops: List[np.ndarray], size: Tuple[int, int]) -> np.ndarray:
+    return np.stack([resize_with_padding(crop, size) for crop in crops])
+
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-10)
+
+
+def embed_faces(
+    crops: List[np.ndarray], model_name: str = "Facenet512", batch_size: int = 32
+) -> np.ndarray:
+    # crops are bgr face images, the result is one l2 normalized row per crop
+    model = load_model(model_name)
+    size = input_size(model)
+    embeddings = []
+    for start in range(0, len(crops), batch_size):
+        batch = preprocess_faces(crops[start : start + batch_size], size)
+        embeddings.append(np.asarray(model(batch, training=False)))
+    if not embeddings:
+        return np.empty((0, model.output_shape[-1]), dtype=np.float32)
+    return l2_normalize(np.concatenate(embeddings).astype(np.float32))
+
+
+def preprocess_emotions(crops: List[np.ndarray], size: Tuple[int, int]) -> np.ndarray:
+    # same steps as deepface.analyze: the face is padded to 224x224 first,
+    # only that square goes to gray and down to the model input, so a tight
+    # non square crop keeps its aspect ratio
+    height, width = size
+    gray = [
+        cv2.resize(
+            cv2.cvtColor(resize_with_padding(crop, FACE_SIZE), cv2.COLOR_BGR2GRAY),
+            (width, height),
+        )
+        for crop in crops
+    ]
+    return np.stack(gray)[..., None].astype(np.float32)
+
+
+def predict_emotions(crops: List[np.ndarray]) -> np.ndarray:
+    # crops are bgr face images, the result is one row of probabilities per
+    # crop in the order of helpers.timeline.EMOTIONS
+    model = load_model("Emotion")
+    if not crops:
+        return np.empty((0, model.output_shape[-1]), dtype=np.float32)
+    batch = preprocess_emotions(crops, input_size(model))
+    predictions = np.asarray(model(batch, training=False))
+    return predictions / predictions.sum(axis=1, keepdims=True)
@@ -0,0 +1,84 @@
+import time
+from typing import Dict, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(
+        self,
+        threshold: float = 0.01,
+        pixel_threshold: int = 20,
+        size: Tuple[int, int] = (80, 60),
+        max_interval: float = 1.0,
+    ) -> None:
+        # threshold is the fraction of thumbnail pixels that must change
+        # before the detector runs again, max_interval forces a refresh so
+        # slow changes and detector misses never stick around for long
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.size = size
+        self.max_interval = max_interval
+
+        width, height = size
+        self.thumbnail = np.empty((height, width), dtype=np.uint8)
+        self.reference = np.empty((height, width), dtype=np.uint8)
+        self.difference = np.empty((height, width), dtype=np.uint8)
+        self.has_reference = False
+        self.last_run = 0.0
+        self.change = 0.0
+
+        self.frames = 0
+        self.runs = 0
+        self.forced = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        # a tiny blurred grayscale copy, sensor noise averages out and the
+        # comparison costs next to nothing
+        gray = cv2.cvtColor(
+            cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA),
+            cv2.COLOR_BGR2GRAY,
+        )
+        cv2.GaussianBlur(gray, (5, 5), 0, dst=self.thumbnail)
+        return self.thumbnail
+
+    def __call__(self, frame: np.ndarray, timestamp: Union[float, None] = None) -> bool:
+        # true when the previous results are stale and inference has to run
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        thumbnail = self._thumbnail(frame)
+        self.frames += 1
+
+        run = not self.has_reference
+        if not run:
+            # compared with the frame of the last run, not the previous frame,
+            # so a slow drift adds up until it crosses the threshold
+            cv2.absdiff(thumbnail, self.reference, dst=self.difference)
+            self.change = (
+                np.count_nonzero(self.difference > self.pixel_threshold)
+                / self.difference.size
+            )
+            run = self.change >= self.threshold
+            if not run and timestamp - self.last_run >= self.max_interval:
+                run = True
+                self.forced += 1
+
+        if run:
+            self.reference[:] = thumbnail
+            self.has_reference = True
+            self.last_run = timestamp
+            self.runs += 1
+        return run
+
+    def reset(self) -> None:
+        self.has_reference = False
+
+    def stats(self) -> Dict[str, float]:
+        skipped = self.frames - self.runs
+        return {
+            "frames": self.frames,
+            "runs": self.runs,
+            "forced": self.forced,
+            "skipped": skipped,
+            "skip_ratio": skipped / self.frames if self.frames else 0.0,
+        }
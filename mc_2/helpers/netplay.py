@@ -0,0 +1,167 @@
+import socket
+import struct
+from typing import Any, Dict, List, Tuple
+
+# an input is (kind, value): kind 0 is a direction, kind 1 an absolute position
+PlayerInput = Tuple[int, int]
+NEUTRAL_INPUT: PlayerInput = (0, 0)
+
+_HEADER = struct.Struct("!iiB")
+_INPUT = struct.Struct("!Bh")
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class RollbackSession:
+    def __init__(
+        self,
+        game: Any,
+        local_player: int,
+        local_port: int,
+        peer_address: Tuple[str, int],
+        max_rollback: int = 12,
+    ) -> None:
+        # the game needs snapshot(), restore(state) and step(inputs), where
+        # inputs holds one PlayerInput per player in player order
+        self.game = game
+        self.local_player = local_player
+        self.remote_player = 1 - local_player
+        # resolved once, received datagrams are compared against it
+        self.peer_address = (socket.gethostbyname(peer_address[0]), peer_address[1])
+        self.max_rollback = max_rollback
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("0.0.0.0", local_port))
+        self.sock.setblocking(False)
+
+        self.frame = 0
+        self.local_inputs: Dict[int, PlayerInput] = {}
+        self.remote_inputs: Dict[int, PlayerInput] = {}
+        self.predicted: Dict[int, PlayerInput] = {}
+        self.snapshots: Dict[int, Any] = {}
+        self.confirmed_frame = -1
+        self.remote_frame = -1
+        self.remote_ack = -1
+        self.rollbacks = 0
+        self.resimulated_frames = 0
+        self.stalls = 0
+
+    def _send(self) -> None:
+        # resend every input the peer has not acknowledged yet, so a lost
+        # datagram is covered by the next one
+        first = max(self.remote_ack + 1, 0)
+        frames = range(first, min(self.frame, first + 255))
+        packet = _HEADER.pack(frames.stop - 1, self.confirmed_frame, len(frames))
+        packet += b"".join(_INPUT.pack(*self.local_inputs[f]) for f in frames)
+        try:
+            self.sock.sendto(packet, self.peer_address)
+        except OSError:
+            pass
+
+    def _receive(self) -> int:
+        # returns the earliest frame whose prediction turned out wrong
+        rollback_to = self.frame
+        while True:
+            try:
+                packet, sender = self.sock.recvfrom(2048)
+            except (BlockingIOError, ConnectionError):
+                break
+            # only the peer may send inputs, truncated datagrams are dropped
+            if sender[:2] != self.peer_address or len(packet) < _HEADER.size:
+                continue
+            last_frame, ack, count = _HEADER.unpack_from(packet)
+            if len(packet) < _HEADER.size + count * _INPUT.size:
+                continue
+            if last_frame - count + 1 < 0:
+                continue
+            self.remote_ack = max(self.remote_ack, ack)
+            self.remote_frame = max(self.remote_frame, last_frame)
+            first = last_frame - count + 1
+            for i in range(count):
+                frame = first + i
+                if frame in self.remote_inputs or frame <= self.confirmed_frame:
+                    continue
+                remote_input = _INPUT.unpack_from(
+                    packet, _HEADER.size + i * _INPUT.size
+                )
+                self.remote_inputs[frame] = remote_input
+                if frame in self.predicted and self.predicted[frame] != remote_input:
+                    rollback_to = min(rollback_to, frame)
+
+        while self.confirmed_frame + 1 in self.remote_inputs:
+            self.confirmed_frame += 1
+        return rollback_to
+
+    def _remote_input(self, frame: int) -> PlayerInput:
+        if frame in self.remote_inputs:
+            return self.remote_inputs[frame]
+        # prediction: the peer keeps doing what it did last
+        previous = [f for f in self.remote_inputs if f < frame]
+        if not previous:
+            return NEUTRAL_INPUT
+        return self.remote_inputs[max(previous)]
+
+    def _simulate(self, frame: int) -> None:
+        self.snapshots[frame] = self.game.snapshot()
+        remote_input = self._remote_input(frame)
+        self.predicted[frame] = remote_input
+        inputs: List[PlayerInput] = [NEUTRAL_INPUT, NEUTRAL_INPUT]
+        inputs[self.local_player] = self.local_inputs[frame]
+        inputs[self.remote_player] = remote_input
+        self.game.step(inputs)
+
+    def _prune(self) -> None:
+        # confirmed and simulated frames can never be rolled back to again,
+        # the latest of them stays as the base for predictions
+        horizon = min(self.confirmed_frame, self.frame - 1)
+        for frame in [f for f in self.snapshots if f < horizon]:
+            del self.snapshots[frame]
+            self.predicted.pop(frame, None)
+        for frame in [f for f in self.remote_inputs if f < horizon]:
+            del self.remote_inputs[frame]
+        # local inputs are kept while the peer may still miss them or a
+        # rollback may still replay them
+        oldest = min(self.remote_ack, horizon)
+        for frame in [f for f in self.local_inputs if f < oldest]:
+            del self.local_inputs[frame]
+
+    def poll(self) -> None:
+        rollback_to = self._receive()
+        if rollback_to < self.frame:
+            # restore the last correct state and replay with the real inputs
+            self.game.restore(self.snapshots[rollback_to])
+            for frame in range(rollback_to, self.frame):
+                self._simulate(frame)
+            self.rollbacks += 1
+            self.resimulated_frames += self.frame - rollback_to
+        self._send()
+
+    def advance(self, local_input: PlayerInput) -> bool:
+        self.poll()
+
+        # never run further ahead of the peer than a rollback can repair
+        if self.frame - self.confirmed_frame > self.max_rollback:
+            self.stalls += 1
+            return False
+
+        self.local_inputs[self.frame] = local_input
+        self._simulate(self.frame)
+        self.frame += 1
+        self._send()
+        self._prune()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "frame": self.frame,
+            "confirmed_frame": self.confirmed_frame,
+            "rollbacks": self.rollbacks,
+            "resimulated_frames": self.resimulated_frames,
+            "stalls": self.stalls,
+        }
+
+    def close(self) -> None:
+        self.sock.close()
@@ -0,0 +1,252 @@
+import json
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+import cv2
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.detections import DetectionBatch
+from helpers.draw import draw_bbox_face_detection, draw_emotion
+from helpers.models import detect_faces, predict_emotions
+from helpers.quality import crop_box
+from helpers.timeline import EMOTIONS
+
+MODES = ("detection", "emotion")
+
+
+def _init_worker(threads: int) -> None:
+    # several workers share the cpu, so each one gets a slice of the threads,
+    # for onnx sessions too unless the engine config fixes a count
+    from helpers.engine import INFERENCE_ENGINE
+
+    if not INFERENCE_ENGINE["threads"]:
+        INFERENCE_ENGINE["threads"] = threads
+
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _analyze_frame(frame, mode: str, detector_backend: str) -> List[Dict[str, Any]]:
+    # detect_faces drops deepface's whole-frame result for frames without a
+    # face, and both models run on the configured inference engine
+    detections = detect_faces(frame, detector_backend)
+    if mode == "detection":
+        return [
+            {"facial_area": detections.box(i), "confidence": float(confidence)}
+            for i, confidence in enumerate(detections.confidences)
+        ]
+
+    emotions = predict_emotions([crop_box(frame, box) for box in detections.boxes])
+    # percentages, like the deepface.analyze output the results used to hold
+    return [
+        {
+            "region": detections.box(i),
+            "dominant_emotion": EMOTIONS[int(probabilities.argmax())],
+            "emotion": {
+                emotion: float(score) * 100
+                for emotion, score in zip(EMOTIONS, probabilities)
+            },
+        }
+        for i, probabilities in enumerate(emotions)
+    ]
+
+
+def _seek(cap: cv2.VideoCapture, start: int) -> None:
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return
+
+    # some containers cannot seek by frame index, fall back to skipping frames
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(start):
+        if not cap.grab():
+            break
+
+
+def _process_chunk(
+    path: str, start: int, stop: int, mode: str, detector_backend: str
+) -> Tuple[int, List[List[Dict[str, Any]]]]:
+    cap = cv2.VideoCapture(path)
+    _seek(cap, start)
+
+    results = []
+    for _ in range(start, stop):
+        ok, frame = cap.read()
+        if not ok:
+            break
+        results.append(_analyze_frame(frame, mode, detector_backend))
+
+    cap.release()
+    # a chunk can come back short when decoding fails or the container
+    # overstates its frame count, the start frame keeps the results aligned
+    return start, results
+
+
+class VideoAnnotator:
+    def __init__(
+        self,
+        mode: str = "emotion",
+        detector_backend: str = DETECTOR_BACKEND,
+        workers: Union[int, None] = None,
+        chunk_seconds: float = 10.0,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.mode = mode
+        self.detector_backend = detector_backend
+        self.workers = workers if workers else max(1, (os.cpu_count() or 2) // 2)
+        self.chunk_seconds = chunk_seconds
+
+    def _chunks(self, frame_count: int, fps: float) -> List[Tuple[int, int]]:
+        chunk_frames = max(1, int(self.chunk_seconds * fps))
+        # never leave workers idle on short videos
+        chunk_frames = min(chunk_frames, math.ceil(frame_count / self.workers))
+        return [
+            (start, min(start + chunk_frames, frame_count))
+            for start in range(0, frame_count, chunk_frames)
+        ]
+
+    def _draw(self, frame, faces: List[Dict[str, Any]]) -> None:
+        detections = DetectionBatch.from_deepface(faces)
+        if self.mode == "detection":
+            draw_bbox_face_detection(frame, detections)
+        else:
+            draw_emotion(frame, detections)
+
+    def _encode(
+        self,
+        input_path: str,
+        output_path: str,
+        results_path: str,
+        fps: float,
+        chunks: "queue.Queue[Union[Tuple[int, List[List[Dict[str, Any]]]], None]]",
+        errors: List[BaseException],
+    ) -> None:
+        try:
+            self._encode_chunks(input_path, output_path, results_path, fps, chunks)
+        except BaseException as error:
+            # the caller re-raises it once the workers are done
+            errors.append(error)
+            # keep draining so the producer never waits on a dead encoder
+            while chunks.get() is not None:
+                pass
+
+    def _encode_chunks(
+        self,
+        input_path: str,
+        output_path: str,
+        results_path: str,
+        fps: float,
+        chunks: "queue.Queue[Union[Tuple[int, List[List[Dict[str, Any]]]], None]]",
+    ) -> None:
+        cap = cv2.VideoCapture(input_path)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        writer = cv2.VideoWriter(
+            output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+
+        # the workers only send back small per-frame results, the frames are
+        # decoded a second time here in order so no pixels cross processes.
+        # frames a short chunk never analyzed are written without boxes and
+        # get no line in the results, every result goes to its own frame
+        index = 0
+        try:
+            with open(results_path, "w") as results_file:
+                while (chunk := chunks.get()) is not None:
+                    start, results = chunk
+                    for frame_index in range(index, start + len(results)):
+                        ok, frame = cap.read()
+                        if not ok:
+                            break
+                        index = frame_index + 1
+                        if frame_index < start:
+                            writer.write(frame)
+                            continue
+                        faces = results[frame_index - start]
+                        self._draw(frame, faces)
+                        writer.write(frame)
+                        results_file.write(
+                            json.dumps(
+                                {
+                                    "frame": frame_index,
+                                    "timestamp": frame_index / fps,
+                                    "faces": faces,
+                                }
+                            )
+                            + "\n"
+                        )
+        finally:
+            writer.release()
+            cap.release()
+
+    def process(
+        self, input_path: str, output_path: str, results_path: str
+    ) -> Dict[str, float]:
+        cap = cv2.VideoCapture(input_path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video {input_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if frame_count <= 0:
+            raise ValueError(f"Cannot determine frame count of {input_path}")
+
+        start_time = time.perf_counter()
+        chunks = self._chunks(frame_count, fps)
+        pending: "queue.Queue[Union[Tuple[int, List[List[Dict[str, Any]]]], None]]" = (
+            queue.Queue()
+        )
+        errors: List[BaseException] = []
+        encoder = threading.Thread(
+            target=self._encode,
+            args=(input_path, output_path, results_path, fps, pending, errors),
+            daemon=True,
+        )
+        encoder.start()
+
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn so every worker loads its own inference runtime
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _process_chunk,
+                    input_path,
+                    start,
+                    stop,
+                    self.mode,
+                    self.detector_backend,
+                )
+                for start, stop in chunks
+            ]
+            try:
+                for future in futures:
+                    pending.put(future.result())
+            finally:
+                pending.put(None)
+                encoder.join()
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - start_time
+        duration = frame_count / fps
+        return {
+            "frames": frame_count,
+            "chunks": len(chunks),
+            "duration": duration,
+            "elapsed": elapsed,
+            "realtime_factor": duration / elapsed if elapsed else 0.0,
+        }
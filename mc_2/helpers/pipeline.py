@@ -0,0 +1,183 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Sequence, Union
+
+import numpy as np
+
+from helpers.backend import DETECTOR_BACKEND
+from helpers.detections import DetectionBatch
+from helpers.models import (
+    detect_faces,
+    embed_faces,
+    input_size,
+    load_model,
+    predict_emotions,
+    preprocess_faces,
+)
+from helpers.quality import FaceQualityGate, align_crop
+from helpers.timeline import EMOTIONS
+
+GENDERS = ("Woman", "Man")
+
+
+class Head(ABC):
+    name = "head"
+
+    def __init__(self, batch_size: int = 32) -> None:
+        self.batch_size = batch_size
+
+    @abstractmethod
+    def predict(self, crops: List[np.ndarray]) -> np.ndarray:
+        pass
+
+    def label(self, output: Any) -> str:
+        return ""
+
+    def __call__(self, crops: List[np.ndarray]) -> np.ndarray:
+        # every head batches on its own, a cheap head can take bigger batches
+        outputs = [
+            self.predict(crops[start : start + self.batch_size])
+            for start in range(0, len(crops), self.batch_size)
+        ]
+        if not outputs:
+            return self.predict([])
+        return np.concatenate(outputs)
+
+
+class EmbeddingHead(Head):
+    name = "embedding"
+
+    def __init__(self, model_name: str = "Facenet512", batch_size: int = 32) -> None:
+        super().__init__(batch_size)
+        self.model_name = model_name
+
+    def predict(self, crops: List[np.ndarray]) -> np.ndarray:
+        return embed_faces(crops, self.model_name, batch_size=self.batch_size)
+
+
+class EmotionHead(Head):
+    name = "emotion"
+
+    def predict(self, crops: List[np.ndarray]) -> np.ndarray:
+        return predict_emotions(crops)
+
+    def label(self, output: np.ndarray) -> str:
+        return EMOTIONS[int(output.argmax())]
+
+
+class _ClassifierHead(Head):
+    model_name = ""
+
+    def predict(self, crops: List[np.ndarray]) -> np.ndarray:
+        model = load_model(self.model_name)
+        if not crops:
+            return np.empty((0, model.output_shape[-1]), dtype=np.float32)
+        batch = preprocess_faces(crops, input_size(model))
+        return np.asarray(model(batch, training=False))
+
+
+class AgeHead(_ClassifierHead):
+    name = "age"
+    model_name = "Age"
+
+    def predict(self, crops: List[np.ndarray]) -> np.ndarray:
+        # the model scores every age from 0 to 100, the expected value is
+        # the apparent age
+        probabilities = super().predict(crops)
+        return probabilities @ np.arange(probabilities.shape[1], dtype=np.float32)
+
+    def label(self, output: float) -> str:
+        return f"{output:.0f}y"
+
+
+class GenderHead(_ClassifierHead):
+    name = "gender"
+    model_name = "Gender"
+
+    def label(self, output: np.ndarray) -> str:
+        return GENDERS[int(output.argmax())]
+
+
+class FaceAnalysis:
+    __slots__ = ("detections", "outputs")
+
+    def __init__(
+        self, detections: DetectionBatch, outputs: Dict[str, np.ndarray]
+    ) -> None:
+        # one row per face in every output, in the order of the detections
+        self.detections = detections
+        self.outputs = outputs
+
+    def __len__(self) -> int:
+        return len(self.detections)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.outputs[name]
+
+    def face(self, index: int) -> Dict[str, Any]:
+        return {
+            "box": self.detections.box(index),
+            "confidence": float(self.detections.confidences[index]),
+            **{name: output[index] for name, output in self.outputs.items()},
+        }
+
+
+class AnalysisPipeline:
+    def __init__(
+        self,
+        heads: Sequence[Head],
+        detector_backend: str = DETECTOR_BACKEND,
+        align: bool = True,
+        quality_gate: Union[FaceQualityGate, None] = None,
+    ) -> None:
+        self.heads = list(heads)
+        self.detector_backend = detector_backend
+        self.align = align
+        self.quality_gate = quality_gate
+        self.timings = {name: 0.0 for name in ["detection"] + self.names()}
+        self.frames = 0
+
+    def names(self) -> List[str]:
+        return [head.name for head in self.heads]
+
+    def __call__(
+        self, frame: np.ndarray, detections: Union[DetectionBatch, None] = None
+    ) -> FaceAnalysis:
+        # detection, alignment and cropping run once, every head reuses the
+        # same crops, so another head only adds its own inference
+        start = time.perf_counter()
+        if detections is None:
+            detections = detect_faces(frame, self.detector_backend)
+        if self.quality_gate is not None:
+            detections = self.quality_gate(frame, detections)
+        landmarks = detections.landmarks if self.align else None
+        crops = [
+            align_crop(frame, box, None if landmarks is None else landmarks[i])
+            for i, box in enumerate(detections.boxes)
+        ]
+        self.timings["detection"] += time.perf_counter() - start
+
+        outputs = {}
+        for head in self.heads:
+            start = time.perf_counter()
+            outputs[head.name] = head(crops)
+            self.timings[head.name] += time.perf_counter() - start
+        self.frames += 1
+        return FaceAnalysis(detections, outputs)
+
+    def labels(self, analysis: FaceAnalysis) -> List[str]:
+        return [
+            " ".join(
+                filter(
+                    None,
+                    (head.label(analysis[head.name][i]) for head in self.heads),
+                )
+            )
+            for i in range(len(analysis))
+        ]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            f"{name}_ms": seconds / self.frames * 1000 if self.frames else 0.0
+            for name, seconds in self.timings.items()
+        }
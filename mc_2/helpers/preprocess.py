@@ -0,0 +1,120 @@
+from typing import Any, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+class FramePreprocessor:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        flip: bool = True,
+        color_conversion: Union[int, None] = None,
+        interpolation: int = cv2.INTER_LINEAR,
+    ) -> None:
+        self.width = width
+        self.height = height
+        self.flip = flip
+        self.color_conversion = color_conversion
+        self.interpolation = interpolation
+
+        # output buffers are allocated once and written in place on every frame
+        self.display = np.empty((height, width, 3), np.uint8)
+        if color_conversion is None:
+            self.model_input = self.display
+        else:
+            self.model_input = np.empty((height, width, 3), np.uint8)
+
+        self._raw = None
+        self._source_shape = None
+        self._map_x = None
+        self._map_y = None
+
+    def _build_maps(self, source_shape: Tuple[int, ...]) -> None:
+        # a single remap does flip and resize in one pass, sampling at the same
+        # pixel centers as cv2.resize with INTER_LINEAR
+        source_height, source_width = source_shape[:2]
+        scale_x = source_width / self.width
+        scale_y = source_height / self.height
+        xs = (np.arange(self.width, dtype=np.float32) + 0.5) * scale_x - 0.5
+        ys = (np.arange(self.height, dtype=np.float32) + 0.5) * scale_y - 0.5
+        if self.flip:
+            xs = (source_width - 1) - xs
+        map_x = np.broadcast_to(xs, (self.height, self.width))
+        map_y = np.broadcast_to(ys[:, None], (self.height, self.width))
+        self._map_x, self._map_y = cv2.convertMaps(
+            np.ascontiguousarray(map_x),
+            np.ascontiguousarray(map_y),
+            cv2.CV_16SC2,
+        )
+        self._source_shape = source_shape
+
+    def _buffers(
+        self, display: Union[np.ndarray, None] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # display can be a caller owned buffer, e.g. a shared memory slot, the
+        # frame is then written there instead of into the reused one
+        if display is None:
+            display = self.display
+        model_input = display if self.color_conversion is None else self.model_input
+        return display, model_input
+
+    def process(
+        self, frame: np.ndarray, display: Union[np.ndarray, None] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        display, model_input = self._buffers(display)
+        if frame.shape[:2] == (self.height, self.width):
+            if self.flip:
+                cv2.flip(frame, 1, dst=display)
+            else:
+                np.copyto(display, frame)
+        elif self.flip:
+            if self._source_shape != frame.shape:
+                self._build_maps(frame.shape)
+            cv2.remap(
+                frame,
+                self._map_x,
+                self._map_y,
+                self.interpolation,
+                dst=display,
+                borderMode=cv2.BORDER_REPLICATE,
+            )
+        else:
+            cv2.resize(
+                frame,
+                (self.width, self.height),
+                dst=display,
+                interpolation=self.interpolation,
+            )
+
+        if self.color_conversion is not None:
+            cv2.cvtColor(display, self.color_conversion, dst=model_input)
+
+        return display, model_input
+
+    def read(
+        self, cap: cv2.VideoCapture, display: Union[np.ndarray, None] = None
+    ) -> Tuple[bool, np.ndarray, np.ndarray]:
+        # decode straight into the reused raw buffer once its shape is known
+        if self._raw is None:
+            ok, self._raw = cap.read()
+        else:
+            ok, self._raw = cap.read(self._raw)
+        if not ok or self._raw is None:
+            # nothing was written, the buffers still hold the previous frame
+            return (False, *self._buffers(display))
+        display, model_input = self.process(self._raw, display)
+        return True, display, model_input
+
+    def read_timestamped(
+        self, cap: Any, display: Union[np.ndarray, None] = None
+    ) -> Tuple[bool, np.ndarray, np.ndarray, float]:
+        # for LatestFrameCapture: the frame and its capture time come from the
+        # same read, and the capture thread hands out a new frame each time,
+        # so there is no raw buffer worth reusing
+        ok, frame, timestamp = cap.read_timestamped()
+        if not ok or frame is None:
+            return (False, *self._buffers(display), timestamp)
+        display, model_input = self.process(frame, display)
+        return True, display, model_input, timestamp
@@ -0,0 +1,72 @@
+from typing import Tuple, Union
+
+import numpy as np
+import pygame
+
+LAYOUTS = ("pip", "split")
+CORNERS = ("top-left", "top-right", "bottom-left", "bottom-right")
+
+
+def preview_layout(
+    game_size: Tuple[int, int],
+    frame_size: Tuple[int, int],
+    layout: str = "pip",
+    scale: float = 0.25,
+    corner: str = "bottom-right",
+    margin: int = 10,
+) -> Tuple[Tuple[int, int], pygame.Rect, pygame.Rect]:
+    # returns the window size, where the game goes and where the camera goes
+    game_width, game_height = game_size
+    width = int(frame_size[0] * scale)
+    height = int(frame_size[1] * scale)
+
+    if layout == "split":
+        # the camera sits next to the game, vertically centered
+        window_size = (game_width + width, max(game_height, height))
+        game_rect = pygame.Rect(0, (window_size[1] - game_height) // 2, *game_size)
+        preview_rect = pygame.Rect(
+            game_width, (window_size[1] - height) // 2, width, height
+        )
+        return window_size, game_rect, preview_rect
+
+    if layout == "pip":
+        if corner not in CORNERS:
+            raise ValueError(f"corner must be one of {CORNERS}")
+        vertical, horizontal = corner.split("-")
+        x = margin if horizontal == "left" else game_width - width - margin
+        y = margin if vertical == "top" else game_height - height - margin
+        game_rect = pygame.Rect(0, 0, *game_size)
+        return game_size, game_rect, pygame.Rect(x, y, width, height)
+
+    raise ValueError(f"layout must be one of {LAYOUTS}")
+
+
+class CameraPreview:
+    def __init__(self, window: pygame.Surface, rect: pygame.Rect) -> None:
+        self.window = window
+        self.rect = rect
+        self.scaled: Union[pygame.Surface, None] = None
+
+    def draw(self, frame: Union[np.ndarray, None]) -> None:
+        if frame is None:
+            return
+        # the surface reads the bgr pixels straight from the numpy buffer,
+        # the only copy is the scale into the preview rectangle
+        height, width = frame.shape[:2]
+        surface = pygame.image.frombuffer(
+            np.ascontiguousarray(frame), (width, height), "BGR"
+        )
+        if surface.get_size() == self.rect.size:
+            self.window.blit(surface, self.rect)
+            return
+        if self.scaled is None:
+            self.scaled = pygame.Surface(self.rect.size, 0, surface)
+        pygame.transform.smoothscale(surface, self.rect.size, self.scaled)
+        self.window.blit(self.scaled, self.rect)
+
+
+def quit_requested(event: pygame.event.Event) -> bool:
+    # q used to close the opencv window, it now closes the pygame one
+    return event.type == pygame.QUIT or (
+        event.type == pygame.KEYDOWN and event.key == pygame.K_q
+    )
@@ -0,0 +1,160 @@
+from typing import Dict, Tuple, Union
+
+import cv2
+import numpy as np
+
+from helpers.detections import DetectionBatch
+
+REASONS = ("size", "confidence", "pose", "sharpness")
+
+
+def crop_box(frame: np.ndarray, box: np.ndarray) -> np.ndarray:
+    x, y, w, h = (int(value) for value in box)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+    return frame[y0:y1, x0:x1]
+
+
+def align_crop(
+    frame: np.ndarray, box: np.ndarray, eyes: Union[np.ndarray, None] = None
+) -> np.ndarray:
+    # rotates the face crop so the eyes sit on a horizontal line, the same
+    # alignment deepface does before each of its models
+    crop = crop_box(frame, box)
+    if eyes is None or np.isnan(eyes).any() or not crop.size:
+        return crop
+    first, second = sorted(eyes.tolist())
+    angle = np.degrees(np.arctan2(second[1] - first[1], second[0] - first[0]))
+    height, width = crop.shape[:2]
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(
+        crop, rotation, (width, height), borderMode=cv2.BORDER_REPLICATE
+    )
+
+
+class FaceQualityGate:
+    def __init__(
+        self,
+        min_size: int = 48,
+        min_confidence: float = 0.5,
+        min_sharpness: float = 50.0,
+        max_yaw: float = 0.35,
+        max_roll: float = 25.0,
+        sharpness_size: int = 64,
+    ) -> None:
+        self.min_size = min_size
+        self.min_confidence = min_confidence
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.sharpness_size = sharpness_size
+
+        self.seen = 0
+        self.passed = 0
+        self.skipped = {reason: 0 for reason in REASONS}
+        self.pose_unchecked = 0
+        self.downstream_time = 0.0
+        self.downstream_faces = 0
+
+    def sharpness(self, frame: np.ndarray, box: np.ndarray) -> float:
+        crop = crop_box(frame, box)
+        if crop.size == 0:
+            return 0.0
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        # a fixed working size keeps the score comparable between face sizes
+        gray = cv2.resize(
+            gray,
+            (self.sharpness_size, self.sharpness_size),
+            interpolation=cv2.INTER_AREA,
+        )
+        return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+    def pose(self, detections: DetectionBatch) -> Tuple[np.ndarray, np.ndarray]:
+        # yaw is the eye midpoint offset from the box center relative to the half
+        # width, roll is the tilt of the eye line in degrees. pose needs eye
+        # landmarks, deepface 0.0.81 reports none in facial_area, so only the
+        # onnx yolov8 engine from helpers.engine gets faces judged on pose
+        count = len(detections)
+        if detections.landmarks is None:
+            return np.zeros(count), np.zeros(count)
+        left_eye = detections.landmarks[:, 0]
+        right_eye = detections.landmarks[:, 1]
+        centers = detections.centers()
+        widths = np.maximum(detections.boxes[:, 2], 1)
+        eye_mid_x = (left_eye[:, 0] + right_eye[:, 0]) / 2
+        yaw = np.abs(eye_mid_x - centers[:, 0]) / (widths / 2)
+        delta = right_eye - left_eye
+        roll = np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+        roll = np.abs((roll + 90) % 180 - 90)
+        # faces without landmarks are not judged on pose
+        return np.nan_to_num(yaw), np.nan_to_num(roll)
+
+    def evaluate(
+        self, frame: np.ndarray, detections: DetectionBatch
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        count = len(detections)
+        sizes = np.minimum(detections.boxes[:, 2], detections.boxes[:, 3])
+        yaw, roll = self.pose(detections)
+        sharpness = np.full(count, np.nan)
+
+        checks = {
+            "size": sizes >= self.min_size,
+            "confidence": detections.confidences >= self.min_confidence,
+            "pose": (yaw <= self.max_yaw) & (roll <= self.max_roll),
+        }
+        keep = checks["size"] & checks["confidence"] & checks["pose"]
+
+        # the laplacian is the only per-pixel check, run it on survivors only
+        for i in np.flatnonzero(keep):
+            sharpness[i] = self.sharpness(frame, detections.boxes[i])
+        checks["sharpness"] = ~keep | (sharpness >= self.min_sharpness)
+        keep &= checks["sharpness"]
+
+        # each rejected face is counted once, under the first check it failed
+        failed = ~keep
+        for reason in REASONS:
+            first = failed & ~checks[reason]
+            self.skipped[reason] += int(first.sum())
+            failed &= checks[reason]
+        self.seen += count
+        self.passed += int(keep.sum())
+        if detections.landmarks is None:
+            self.pose_unchecked += count
+        else:
+            self.pose_unchecked += int(np.isnan(detections.landmarks).any((1, 2)).sum())
+
+        scores = {
+            "size": sizes,
+            "confidence": detections.confidences,
+            "yaw": yaw,
+            "roll": roll,
+            "sharpness": sharpness,
+        }
+        return keep, scores
+
+    def __call__(
+        self, frame: np.ndarray, detections: DetectionBatch
+    ) -> DetectionBatch:
+        keep, _ = self.evaluate(frame, detections)
+        return detections[keep]
+
+    def record_downstream(self, seconds: float, faces: int) -> None:
+        self.downstream_time += seconds
+        self.downstream_faces += faces
+
+    def stats(self) -> Dict[str, float]:
+        skipped = self.seen - self.passed
+        per_face = 0.0
+        if self.downstream_faces:
+            per_face = self.downstream_time / self.downstream_faces
+        stats = {
+            "seen": self.seen,
+            "passed": self.passed,
+            "skipped": skipped,
+            "skipped_ratio": skipped / self.seen if self.seen else 0.0,
+            "seconds_saved": skipped * per_face,
+            "pose_unchecked": self.pose_unchecked,
+        }
+        for reason, count in self.skipped.items():
+            stats[f"skipped_{reason}"] = count
+        return stats
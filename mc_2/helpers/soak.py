@@ -0,0 +1,157 @@
+import gc
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+
+def rss_mb() -> float:
+    # current resident memory, linux reads it from /proc, elsewhere only the
+    # peak is available, which still grows when memory leaks
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def object_counts() -> Counter:
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+class SoakMonitor:
+    def __init__(
+        self,
+        interval: int = 500,
+        warmup: int = 1000,
+        fps: float = 30.0,
+        max_slope: float = 5.0,
+        trace: bool = True,
+        trace_frames: int = 10,
+        top: int = 10,
+    ) -> None:
+        # frames are counted, not seconds, so a replay faster than realtime
+        # still reports growth per hour of camera time at the given fps,
+        # max_slope is in MB per such hour
+        self.interval = interval
+        self.warmup = warmup
+        self.fps = fps
+        self.max_slope = max_slope
+        self.trace = trace
+        self.trace_frames = trace_frames
+        self.top = top
+
+        self.frames = 0
+        self.samples: List[Dict[str, float]] = []
+        self.baseline_snapshot: Union[tracemalloc.Snapshot, None] = None
+        self.baseline_objects: Counter = Counter()
+        self.snapshot: Union[tracemalloc.Snapshot, None] = None
+        self.objects: Counter = Counter()
+        self.started = time.perf_counter()
+
+    def start(self) -> None:
+        if self.trace:
+            tracemalloc.start(self.trace_frames)
+        self.started = time.perf_counter()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            )
+        )
+
+    def stop(self) -> None:
+        # snapshots are only taken at the baseline and here, taking them at
+        # every sample fragments the heap and shows up as rss growth itself
+        if self.trace:
+            self.snapshot = self._take_snapshot()
+            tracemalloc.stop()
+
+    def _sample(self, baseline: bool = False) -> None:
+        gc.collect()
+        sample = {
+            "frame": self.frames,
+            "seconds": time.perf_counter() - self.started,
+            "rss_mb": rss_mb(),
+            "traced_mb": 0.0,
+        }
+        if self.trace:
+            # tracemalloc's own trace storage grows too, it is not the loop's
+            sample["rss_mb"] -= tracemalloc.get_tracemalloc_memory() / 1024 / 1024
+            sample["traced_mb"] = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        if baseline and self.trace:
+            self.baseline_snapshot = self._take_snapshot()
+        # the baseline is counted after its snapshot exists, so the monitor's
+        # own bookkeeping cancels out of the object growth
+        self.objects = object_counts()
+        if baseline:
+            self.baseline_objects = self.objects
+        sample["objects"] = sum(self.objects.values())
+        self.samples.append(sample)
+
+    def step(self) -> None:
+        # call once per processed frame, samples are taken every interval
+        # frames, the first one after warmup is the baseline
+        self.frames += 1
+        if self.frames == self.warmup:
+            self._sample(baseline=True)
+        elif self.frames > self.warmup and self.frames % self.interval == 0:
+            self._sample()
+
+    def slope(self, key: str) -> float:
+        # least squares growth of one sampled value, per hour of frames, the
+        # baseline sample is left out because every later one also holds the
+        # baseline snapshot in memory
+        samples = self.samples[1:]
+        if len(samples) < 2:
+            return 0.0
+        frames = np.array([sample["frame"] for sample in samples], float)
+        values = np.array([sample[key] for sample in samples], float)
+        per_frame = np.polyfit(frames, values, 1)[0]
+        return float(per_frame * self.fps * 3600)
+
+    def growing_sites(self) -> List[str]:
+        if self.baseline_snapshot is None or self.snapshot is None:
+            return []
+        stats = self.snapshot.compare_to(self.baseline_snapshot, "lineno")
+        growing = [stat for stat in stats if stat.size_diff > 0][: self.top]
+        lines = []
+        for stat in growing:
+            frame = stat.traceback[-1]
+            lines.append(
+                f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks "
+                f"{frame.filename}:{frame.lineno}"
+            )
+        return lines
+
+    def growing_types(self) -> List[str]:
+        growth = self.objects.copy()
+        growth.subtract(self.baseline_objects)
+        return [
+            f"{count:+8d} {name}"
+            for name, count in growth.most_common(self.top)
+            if count > 0
+        ]
+
+    def report(self) -> Dict[str, Any]:
+        rss_slope = self.slope("rss_mb")
+        return {
+            "frames": self.frames,
+            "seconds": time.perf_counter() - self.started,
+            "samples": len(self.samples),
+            "rss_mb": self.samples[-1]["rss_mb"] if self.samples else rss_mb(),
+            "rss_slope": rss_slope,
+            "traced_slope": self.slope("traced_mb"),
+            "objects_slope": self.slope("objects"),
+            "passed": rss_slope <= self.max_slope,
+            "growing_sites": self.growing_sites(),
+            "growing_types": self.growing_types(),
+        }
@@ -0,0 +1,133 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from helpers.detections import DetectionBatch
+
+Tile = Tuple[int, int, int, int]
+
+
+def tile_grid(width: int, height: int, tile: int, overlap: int) -> List[Tile]:
+    # x, y, w, h tiles covering the image, the last row and column are
+    # shifted back to end on the image border instead of running past it
+    def starts(length: int) -> List[int]:
+        if length <= tile:
+            return [0]
+        stride = tile - overlap
+        positions = list(range(0, length - tile, stride))
+        return positions + [length - tile]
+
+    return [
+        (x, y, min(tile, width), min(tile, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def nms(detections: DetectionBatch, iou_threshold: float) -> DetectionBatch:
+    if not len(detections):
+        return detections
+    keep = cv2.dnn.NMSBoxes(
+        detections.boxes.tolist(),
+        detections.confidences.tolist(),
+        0.0,
+        iou_threshold,
+    )
+    keep = np.sort(np.asarray(keep, dtype=np.int64).reshape(-1))
+    return detections[keep]
+
+
+def _on_inner_edge(
+    boxes: np.ndarray, tile: Tile, width: int, height: int, margin: int
+) -> np.ndarray:
+    # a box touching a tile border inside the image is probably a cut face,
+    # the overlapping neighbour tile sees it whole
+    x, y, w, h = tile
+    left = (boxes[:, 0] <= margin) & (x > 0)
+    top = (boxes[:, 1] <= margin) & (y > 0)
+    right = (boxes[:, 0] + boxes[:, 2] >= w - margin) & (x + w < width)
+    bottom = (boxes[:, 1] + boxes[:, 3] >= h - margin) & (y + h < height)
+    return left | top | right | bottom
+
+
+class TiledDetector:
+    def __init__(
+        self,
+        detect: Callable[[np.ndarray], DetectionBatch],
+        tile: int = 640,
+        overlap: int = 160,
+        scales: Sequence[float] = (1.0, 0.5),
+        full_image: bool = True,
+        workers: int = 1,
+        iou_threshold: float = 0.4,
+        edge_margin: int = 2,
+    ) -> None:
+        # overlap should be larger than the biggest face expected in a tile,
+        # bigger faces are found by the coarser scales and the full image.
+        # tiles only run in parallel with workers > 1, which is for detectors
+        # that are safe to call from several threads, see thread_safe_detector
+        self.detect = detect
+        self.tile = tile
+        self.overlap = overlap
+        self.scales = scales
+        self.full_image = full_image
+        self.workers = workers
+        self.iou_threshold = iou_threshold
+        self.edge_margin = edge_margin
+        self.tiles_run = 0
+
+    def _detect_tile(self, img: np.ndarray, tile: Tile, scale: float) -> DetectionBatch:
+        x, y, w, h = tile
+        # a view, tiles never copy the scaled image
+        detections = self.detect(img[y : y + h, x : x + w])
+        if not len(detections):
+            return detections
+
+        edge = _on_inner_edge(
+            detections.boxes, tile, img.shape[1], img.shape[0], self.edge_margin
+        )
+        detections = detections[~edge]
+        offset = np.array([x, y], dtype=np.float32)
+        boxes = detections.boxes.astype(np.float32)
+        boxes[:, :2] += offset
+        landmarks = detections.landmarks
+        if landmarks is not None:
+            landmarks = (landmarks + offset) / scale
+        return DetectionBatch(
+            np.round(boxes / scale), detections.confidences, landmarks
+        )
+
+    def __call__(self, img: np.ndarray) -> DetectionBatch:
+        batches = []
+        executor = None
+        if self.workers > 1:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for scale in self.scales:
+                # one scaled copy alive at a time keeps memory bounded by the
+                # largest scale, not by the number of tiles
+                scaled = img
+                if scale != 1.0:
+                    scaled = cv2.resize(
+                        img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+                    )
+                tiles = tile_grid(
+                    scaled.shape[1], scaled.shape[0], self.tile, self.overlap
+                )
+                detect_tile = functools.partial(self._detect_tile, scaled, scale=scale)
+                if executor is None:
+                    batches.extend(map(detect_tile, tiles))
+                else:
+                    batches.extend(executor.map(detect_tile, tiles))
+                self.tiles_run += len(tiles)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if self.full_image:
+            batches.append(self.detect(img))
+
+        return nms(DetectionBatch.concatenate(batches), self.iou_threshold)
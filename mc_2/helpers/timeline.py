@@ -0,0 +1,156 @@
+import os
+import time
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+EMOTIONS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+
+
+def emotion_vector(emotion: Dict[str, float]) -> np.ndarray:
+    # deepface reports percentages, the timeline keeps probabilities
+    return np.array([emotion[name] for name in EMOTIONS], dtype=np.float32) / 100
+
+
+class EmotionTimeline:
+    def __init__(
+        self,
+        output_dir: str,
+        window: int = 90,
+        max_tracks: int = 32,
+        flush_interval: float = 60.0,
+        stale_after: float = 10.0,
+        session: Union[str, None] = None,
+    ) -> None:
+        self.output_dir = output_dir
+        self.window = window
+        self.max_tracks = max_tracks
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after
+        os.makedirs(output_dir, exist_ok=True)
+        # snapshot numbers restart every run, the session keeps the files of
+        # earlier runs in the same directory from being overwritten
+        if session is None:
+            session = time.strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+        self.session = session
+
+        # every array is sized once by max_tracks, a slot is reused when its
+        # track goes stale so memory does not grow with session length
+        emotions = len(EMOTIONS)
+        self.slot_ids = np.full(max_tracks, -1, dtype=np.int64)
+        self.windows = np.zeros((max_tracks, window, emotions), dtype=np.float32)
+        self.window_pos = np.zeros(max_tracks, dtype=np.int64)
+        self.window_fill = np.zeros(max_tracks, dtype=np.int64)
+        self.count = np.zeros(max_tracks, dtype=np.int64)
+        self.mean = np.zeros((max_tracks, emotions), dtype=np.float64)
+        self.m2 = np.zeros((max_tracks, emotions), dtype=np.float64)
+        self.dominant = np.zeros((max_tracks, emotions), dtype=np.int64)
+        self.interval_sum = np.zeros((max_tracks, emotions), dtype=np.float64)
+        self.interval_count = np.zeros(max_tracks, dtype=np.int64)
+        self.first_seen = np.zeros(max_tracks, dtype=np.float64)
+        self.last_seen = np.zeros(max_tracks, dtype=np.float64)
+
+        self.evicted = 0
+        self.snapshots = 0
+        self.last_flush = None
+
+    def _reset_slot(self, slot: int, track_id: int, timestamp: float) -> None:
+        self.slot_ids[slot] = track_id
+        self.windows[slot] = 0
+        self.window_pos[slot] = 0
+        self.window_fill[slot] = 0
+        self.count[slot] = 0
+        self.mean[slot] = 0
+        self.m2[slot] = 0
+        self.dominant[slot] = 0
+        self.interval_sum[slot] = 0
+        self.interval_count[slot] = 0
+        self.first_seen[slot] = timestamp
+        self.last_seen[slot] = timestamp
+
+    def _slot(self, track_id: int, timestamp: float) -> int:
+        found = np.flatnonzero(self.slot_ids == track_id)
+        if len(found):
+            return int(found[0])
+        free = np.flatnonzero(self.slot_ids < 0)
+        if len(free):
+            slot = int(free[0])
+        else:
+            # out of slots: the least recently seen track makes room
+            slot = int(self.last_seen.argmin())
+            self.evicted += 1
+        self._reset_slot(slot, track_id, timestamp)
+        return slot
+
+    def update(
+        self,
+        track_ids: Union[np.ndarray, List[int]],
+        emotions: np.ndarray,
+        timestamp: float,
+    ) -> Union[str, None]:
+        if self.last_flush is None:
+            self.last_flush = timestamp
+
+        for track_id, probabilities in zip(track_ids, emotions):
+            slot = self._slot(int(track_id), timestamp)
+            self.windows[slot, self.window_pos[slot]] = probabilities
+            self.window_pos[slot] = (self.window_pos[slot] + 1) % self.window
+            self.window_fill[slot] = min(self.window_fill[slot] + 1, self.window)
+
+            # welford running mean and variance
+            self.count[slot] += 1
+            delta = probabilities - self.mean[slot]
+            self.mean[slot] += delta / self.count[slot]
+            self.m2[slot] += delta * (probabilities - self.mean[slot])
+
+            self.dominant[slot, int(np.argmax(probabilities))] += 1
+            self.interval_sum[slot] += probabilities
+            self.interval_count[slot] += 1
+            self.last_seen[slot] = timestamp
+
+        if timestamp - self.last_flush >= self.flush_interval:
+            return self.flush(timestamp)
+        return None
+
+    def summary(self) -> Dict[str, Any]:
+        active = np.flatnonzero(self.slot_ids >= 0)
+        fill = np.maximum(self.window_fill[active], 1)[:, None]
+        count = np.maximum(self.count[active], 1)[:, None]
+        interval_count = np.maximum(self.interval_count[active], 1)[:, None]
+        return {
+            "emotions": np.array(EMOTIONS),
+            "track_id": self.slot_ids[active],
+            "first_seen": self.first_seen[active],
+            "last_seen": self.last_seen[active],
+            "count": self.count[active],
+            "mean": self.mean[active].astype(np.float32),
+            "std": np.sqrt(self.m2[active] / count).astype(np.float32),
+            "window_mean": (self.windows[active].sum(axis=1) / fill).astype(
+                np.float32
+            ),
+            "interval_count": self.interval_count[active],
+            "interval_mean": (self.interval_sum[active] / interval_count).astype(
+                np.float32
+            ),
+            "dominant_count": self.dominant[active],
+        }
+
+    def flush(self, timestamp: float) -> str:
+        while True:
+            path = os.path.join(
+                self.output_dir, f"timeline_{self.session}_{self.snapshots:06d}.npz"
+            )
+            # two timelines started within the same second share a session
+            if not os.path.exists(path):
+                break
+            self.snapshots += 1
+        np.savez_compressed(path, timestamp=np.float64(timestamp), **self.summary())
+        self.snapshots += 1
+        self.last_flush = timestamp
+
+        self.interval_sum[:] = 0
+        self.interval_count[:] = 0
+        # tracks that left the scene have been written out, free their slots
+        stale = (self.slot_ids >= 0) & (timestamp - self.last_seen > self.stale_after)
+        self.slot_ids[stale] = -1
+        return path
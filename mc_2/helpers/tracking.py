@@ -0,0 +1,94 @@
+import numpy as np
+
+from helpers.detections import DetectionBatch
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    # boxes are x, y, w, h rows, the result is (len(a), len(b))
+    a = boxes_a.astype(np.float32)[:, None, :]
+    b = boxes_b.astype(np.float32)[None, :, :]
+    x0 = np.maximum(a[..., 0], b[..., 0])
+    y0 = np.maximum(a[..., 1], b[..., 1])
+    x1 = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    y1 = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+def greedy_match(scores: np.ndarray, threshold: float):
+    # pairs rows and columns by descending score, each used at most once
+    rows, cols = [], []
+    if scores.size:
+        order = np.argsort(scores, axis=None)[::-1]
+        used_rows, used_cols = set(), set()
+        for flat in order:
+            row, col = divmod(int(flat), scores.shape[1])
+            if scores[row, col] < threshold:
+                break
+            if row in used_rows or col in used_cols:
+                continue
+            used_rows.add(row)
+            used_cols.add(col)
+            rows.append(row)
+            cols.append(col)
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+
+class IouTracker:
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_missed: int = 15,
+        velocity_smoothing: float = 0.5,
+    ) -> None:
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.velocity_smoothing = velocity_smoothing
+        self.next_id = 0
+        self.track_ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocities = np.empty((0, 4), dtype=np.float32)
+        self.missed = np.empty(0, dtype=np.int64)
+        self.new_ids = np.empty(0, dtype=np.int64)
+
+    def predicted_boxes(self) -> np.ndarray:
+        # constant velocity motion, extrapolated over the frames a track missed
+        return self.boxes + self.velocities * (self.missed[:, None] + 1)
+
+    def update(self, detections: DetectionBatch) -> np.ndarray:
+        boxes = detections.boxes.astype(np.float32)
+        ids = np.full(len(boxes), -1, dtype=np.int64)
+
+        track_rows, detection_cols = greedy_match(
+            iou_matrix(self.predicted_boxes(), boxes), self.iou_threshold
+        )
+        ids[detection_cols] = self.track_ids[track_rows]
+        step = (boxes[detection_cols] - self.boxes[track_rows]) / (
+            self.missed[track_rows, None] + 1
+        )
+        self.velocities[track_rows] += self.velocity_smoothing * (
+            step - self.velocities[track_rows]
+        )
+        self.boxes[track_rows] = boxes[detection_cols]
+        self.missed += 1
+        self.missed[track_rows] = 0
+
+        # unmatched detections start new tracks
+        new = np.flatnonzero(ids < 0)
+        ids[new] = np.arange(self.next_id, self.next_id + len(new))
+        self.next_id += len(new)
+        self.new_ids = ids[new]
+        self.track_ids = np.concatenate([self.track_ids, ids[new]])
+        self.boxes = np.concatenate([self.boxes, boxes[new]])
+        self.velocities = np.concatenate(
+            [self.velocities, np.zeros((len(new), 4), np.float32)]
+        )
+        self.missed = np.concatenate([self.missed, np.zeros(len(new), np.int64)])
+
+        alive = self.missed <= self.max_missed
+        self.track_ids = self.track_ids[alive]
+        self.boxes = self.boxes[alive]
+        self.velocities = self.velocities[alive]
+        self.missed = self.missed[alive]
+        return ids